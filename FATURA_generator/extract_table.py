@@ -1,8 +1,10 @@
 import os
+import sys
 import json
-from PIL import Image, ImageDraw, ImageFont
-import pytesseract
-import re
+
+# Modules partagés du dossier parent (cache OCR)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import table_ocr
 
 def extract_table_bbox_from_json(json_path):
     """
@@ -24,6 +26,8 @@ def extract_table_bbox_from_json(json_path):
 def extract_table_data_from_image(image_path, table_bbox):
     """
     Extrait les données du tableau à partir d'une image en utilisant l'OCR.
+    Le texte reconnu est gardé dans le cache OCR (table_ocr.py) : tesseract n'est relancé que si
+    la région, sa version ou sa configuration change.
     
     Args:
         image_path (str): Chemin de l'image.
@@ -32,37 +36,7 @@ def extract_table_data_from_image(image_path, table_bbox):
     Returns:
         list: Données du tableau (liste de listes, chaque liste est une ligne).
     """
-    img = Image.open(image_path)
-    draw = ImageDraw.Draw(img)
-    
-    # Extraire la région de la bounding box
-    x1, y1 = table_bbox[0]
-    x2, y2 = table_bbox[1]
-    
-    y1, y2 = img.height - y1, img.height - y2
-    x1, x2 = min(x1, x2), max(x1, x2)
-    y1, y2 = min(y1, y2), max(y1, y2)
-    
-    table_region = img.crop((x1, y1, x2, y2))  # Inverser y1 et y2 pour correspondre à l'axe y de l'image
-    
-    # Utiliser pytesseract pour extraire le texte de la région du tableau
-    table_text = pytesseract.image_to_string(table_region)
-    
-    # Parse le texte pour récupérer les données du tableau
-    lines = table_text.split("\n")
-    table_data = []
-    for line in lines:
-        if line.strip():
-            columns = line.split()
-            if len(columns) > 3:
-                item_name = ' '.join(columns[:-2])
-                quantity = columns[-2]
-                price = columns[-1]
-                table_data.append([item_name, quantity, price])
-            else:
-                table_data.append(columns)
-    
-    return table_data
+    return table_ocr.extract_table_data_from_image(image_path, table_bbox)
 
 # Exemple d'utilisation
 template_path = "FATURA/preview.jpeg"
@@ -0,0 +1,249 @@
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from PIL import Image
+
+MAGIC = b"FATIDX02"
+SECTIONS = [
+    ("doc_keys", "i", 2),        # modèle, instance
+    ("doc_sizes", "i", 2),       # largeur, hauteur de l'image
+    ("doc_table", "d", 4),       # bbox du tableau
+    ("doc_logo", "d", 4),        # bbox du logo
+    ("doc_flags", "B", 1),
+    ("doc_fields", "I", 1),      # premier champ de chaque document (n + 1 valeurs)
+    ("field_names", "I", 1),     # indice de chaîne du nom du champ
+    ("field_texts", "I", 1),     # indice de chaîne du texte
+    ("field_bboxes", "d", 4),
+    ("doc_ints", "B", 1),        # coordonnées entières dans le JSON : bits 0-3 tableau, 4-7 logo
+    ("field_ints", "B", 1),      # coordonnées entières de la bbox du champ (bits 0-3)
+    ("string_offsets", "I", 1),  # n + 1 valeurs, puis le bloc UTF-8 des chaînes
+]
+# magic, nombre de documents, de champs, de chaînes, puis l'offset de chaque section et du bloc de chaînes
+HEADER = struct.Struct(f"<8sIII{len(SECTIONS) + 1}Q")
+
+JSON_OK = 1
+IMAGE_OK = 2
+HAS_TABLE = 4
+HAS_LOGO = 8
+
+_NAME_RE = re.compile(r'Template(\d+)_Instance(\d+)\.json$')
+
+
+def _bbox(value):
+    # [[x1, y1], [x2, y2]] -> (x1, y1, x2, y2) ; TypeError/ValueError si la bbox est mal formée
+    (x1, y1), (x2, y2) = value
+    bbox = (x1, y1, x2, y2)
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in bbox):
+        raise TypeError(f"coordonnées invalides : {value!r}")
+    return bbox
+
+
+def _int_mask(bbox):
+    # Bit i : la coordonnée i est un entier dans le JSON (stockée en double, rendue en int par record)
+    return sum(1 << i for i, v in enumerate(bbox) if isinstance(v, int))
+
+
+def _coords(values, mask):
+    x1, y1, x2, y2 = (int(v) if mask >> i & 1 else v for i, v in enumerate(values))
+    return [[x1, y1], [x2, y2]]
+
+
+def _scan(json_path, image_path):
+    flags = 0
+    fields = []
+    table = logo = (0.0, 0.0, 0.0, 0.0)
+    size = (0, 0)
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        flags |= JSON_OK
+    except (OSError, ValueError):
+        data = {}
+    for key, content in data.items():
+        # Même critère que le rendu : un champ est dessiné s'il a un 'text' et une 'bbox'
+        if isinstance(content, dict) and 'text' in content and 'bbox' in content:
+            try:
+                fields.append((key, content['text'], _bbox(content['bbox'])))
+            except (TypeError, ValueError):
+                # Champ mal formé : seul ce document est marqué invalide
+                flags &= ~JSON_OK
+    try:
+        table = _bbox(data["TABLE"][0][0]["bbox"])
+        flags |= HAS_TABLE
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass
+    if isinstance(data.get("LOGO"), dict) and "bbox" in data["LOGO"]:
+        try:
+            logo = _bbox(data["LOGO"]["bbox"])
+            flags |= HAS_LOGO
+        except (TypeError, ValueError):
+            flags &= ~JSON_OK
+    try:
+        # Seul l'en-tête JPEG est lu : Image.open ne décode pas les pixels
+        with Image.open(image_path) as img:
+            size = img.size
+        flags |= IMAGE_OK
+    except OSError:
+        pass
+    return flags, fields, table, logo, size
+
+
+def build_index(annotations_folder, images_folder, output_path):
+    """
+    Parcourt une fois Annotations/Original_Format et écrit un index binaire compact :
+    bbox et textes des champs, bbox du tableau et du logo, taille de l'image et indicateurs de validité.
+
+    Args:
+        annotations_folder (str): Dossier des fichiers TemplateK_InstanceI.json.
+        images_folder (str): Dossier des images TemplateK_InstanceI.jpg.
+        output_path (str): Fichier d'index à écrire.
+
+    Returns:
+        int: Nombre de documents indexés.
+    """
+    paths = []
+    for json_path in glob.glob(os.path.join(annotations_folder, "Template*_Instance*.json")):
+        match = _NAME_RE.search(os.path.basename(json_path))
+        if match:
+            paths.append((int(match.group(1)), int(match.group(2)), json_path))
+    paths.sort()
+
+    columns = {name: array(typecode) for name, typecode, _ in SECTIONS}
+    strings = {}
+
+    def string_id(text):
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+
+    for template, instance, json_path in paths:
+        image_path = os.path.join(images_folder, f"Template{template}_Instance{instance}.jpg")
+        flags, fields, table, logo, size = _scan(json_path, image_path)
+        columns["doc_keys"].extend((template, instance))
+        columns["doc_sizes"].extend(size)
+        columns["doc_table"].extend(table)
+        columns["doc_logo"].extend(logo)
+        columns["doc_flags"].append(flags)
+        columns["doc_ints"].append(_int_mask(table) | _int_mask(logo) << 4)
+        columns["doc_fields"].append(len(columns["field_names"]))
+        for name, text, bbox in fields:
+            columns["field_names"].append(string_id(name))
+            columns["field_texts"].append(string_id(text))
+            columns["field_bboxes"].extend(bbox)
+            columns["field_ints"].append(_int_mask(bbox))
+    columns["doc_fields"].append(len(columns["field_names"]))
+
+    blob = bytearray()
+    for text in strings:
+        columns["string_offsets"].append(len(blob))
+        blob += text.encode('utf-8')
+    columns["string_offsets"].append(len(blob))
+
+    with open(output_path, 'wb') as f:
+        f.write(b"\0" * HEADER.size)
+        offsets = []
+        for name, _, _ in SECTIONS:
+            # Sections alignées sur 8 octets pour les vues memoryview.cast
+            f.write(b"\0" * (-f.tell() % 8))
+            offsets.append(f.tell())
+            columns[name].tofile(f)
+        offsets.append(f.tell())
+        f.write(blob)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(paths), len(columns["field_names"]), len(strings), *offsets))
+    return len(paths)
+
+
+class AnnotationIndex:
+    """
+    Index d'annotations FATURA2 ouvert avec un seul mmap ; aucune section n'est décodée au chargement.
+
+    Args:
+        path (str): Fichier produit par build_index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} n'est pas un index d'annotations (ou a été construit par une version antérieure)")
+        magic, self.n_docs, self.n_fields, self.n_strings, *offsets = HEADER.unpack_from(self._mmap)
+        counts = {"doc_fields": self.n_docs + 1, "field_names": self.n_fields, "field_texts": self.n_fields,
+                  "field_bboxes": self.n_fields, "field_ints": self.n_fields, "string_offsets": self.n_strings + 1}
+        for (name, typecode, width), offset in zip(SECTIONS, offsets):
+            length = counts.get(name, self.n_docs) * width * struct.calcsize(typecode)
+            setattr(self, name, view[offset:offset + length].cast(typecode))
+        self._blob = view[offsets[-1]:]
+        keys = self.doc_keys
+        self._positions = {(keys[2 * n], keys[2 * n + 1]): n for n in range(self.n_docs)}
+
+    def __len__(self):
+        return self.n_docs
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def string(self, i):
+        return bytes(self._blob[self.string_offsets[i]:self.string_offsets[i + 1]]).decode('utf-8')
+
+    def flags(self, template, instance):
+        return self.doc_flags[self._positions[(template, instance)]]
+
+    def image_size(self, template, instance):
+        n = self._positions[(template, instance)]
+        return self.doc_sizes[2 * n], self.doc_sizes[2 * n + 1]
+
+    def texts(self, template, instance):
+        n = self._positions[(template, instance)]
+        return [self.string(self.field_texts[j]) for j in range(self.doc_fields[n], self.doc_fields[n + 1])]
+
+    def record(self, template, instance):
+        """
+        Reconstruit les annotations d'un document sous la forme du JSON d'origine
+        (champs dessinables, LOGO et TABLE), ainsi que la taille de l'image. Les coordonnées
+        entières dans le JSON sont rendues en int : le document est identique à celui du fichier.
+
+        Returns:
+            tuple: (data, image_size, flags).
+        """
+        n = self._positions[(template, instance)]
+        flags = self.doc_flags[n]
+        data = {}
+        for j in range(self.doc_fields[n], self.doc_fields[n + 1]):
+            bbox = _coords(self.field_bboxes[4 * j:4 * j + 4], self.field_ints[j])
+            data[self.string(self.field_names[j])] = {"bbox": bbox, "text": self.string(self.field_texts[j])}
+        if flags & HAS_LOGO:
+            data["LOGO"] = {"bbox": _coords(self.doc_logo[4 * n:4 * n + 4], self.doc_ints[n] >> 4)}
+        if flags & HAS_TABLE:
+            data["TABLE"] = [[{"bbox": _coords(self.doc_table[4 * n:4 * n + 4], self.doc_ints[n] & 15)}]]
+        return data, (self.doc_sizes[2 * n], self.doc_sizes[2 * n + 1]), flags
+
+
+_indexes = {}
+
+
+def open_index(path):
+    """
+    Retourne l'index `path`, ouvert une seule fois par processus.
+    """
+    if path not in _indexes:
+        _indexes[path] = AnnotationIndex(path)
+    return _indexes[path]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Construit l'index binaire des annotations FATURA2")
+    parser.add_argument("--dataset", default="FATURA2/invoices_dataset_final", help="dossier du jeu de données FATURA2")
+    parser.add_argument("--output", default="fatura2_annotations.idx", help="fichier d'index à écrire")
+    args = parser.parse_args()
+    count = build_index(os.path.join(args.dataset, "Annotations", "Original_Format"), os.path.join(args.dataset, "images"), args.output)
+    index = AnnotationIndex(args.output)
+    invalid = sum(1 for flags in index.doc_flags if flags & (JSON_OK | IMAGE_OK | HAS_TABLE) != JSON_OK | IMAGE_OK | HAS_TABLE)
+    print(f"{count} documents indexés dans {args.output} ({index.n_fields} champs, {index.n_strings} chaînes distinctes, {invalid} invalides)")
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from metrics import logger, metrics
+
+
+class RateLimitError(Exception):
+    """
+    Requête refusée par le service de traduction (HTTP 429). retry_after : délai demandé en secondes, ou None.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HttpTranslator:
+    """
+    Client d'un service de traduction HTTP compatible LibreTranslate : POST JSON {"q", "source",
+    "target"} vers `url`, réponse {"translatedText"}. Même interface que GoogleTranslator.
+
+    Args:
+        url (str): Adresse du service (par ex. http://localhost:5000/translate).
+        source (str, optional): Langue source.
+        target (str, optional): Langue cible.
+        timeout (float, optional): Délai maximal d'une requête, en secondes.
+        api_key (str, optional): Clé d'API transmise avec chaque requête.
+    """
+
+    def __init__(self, url, source='en', target='fr', timeout=30.0, api_key=None):
+        self.url = url
+        self.source = source
+        self.target = target
+        self.timeout = timeout
+        self.api_key = api_key
+
+    def translate(self, text, **kwargs):
+        payload = {"q": text, "source": self.source, "target": self.target, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)["translatedText"]
+        except urllib.error.HTTPError as e:
+            if e.code != 429:
+                raise
+            try:
+                retry_after = float(e.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+            raise RateLimitError(f"HTTP 429 sur {self.url}", retry_after) from None
+
+    def translate_batch(self, batch, **kwargs):
+        return [self.translate(text) for text in batch]
+
+
+class AsyncTranslator:
+    """
+    Traductions concurrentes pilotées par asyncio, avec une limite de requêtes simultanées,
+    un délai maximal par requête et des nouvelles tentatives avec attente exponentielle.
+
+    Les traducteurs distants (GoogleTranslator, HttpTranslator) sont bloquants : chaque requête
+    est exécutée dans un pool de `concurrency` threads, la boucle asyncio ne fait qu'attendre.
+    Un texte couvert par le traducteur local ou présent dans le cache n'est pas envoyé, et un
+    texte déjà en cours de traduction n'est demandé qu'une fois. Une requête qui dépasse `timeout`
+    (compté à partir de son début dans un thread, pas de son attente dans le pool) est abandonnée
+    (le thread termine la requête HTTP, avec son propre délai) puis retentée. Après `retries`
+    nouvelles tentatives, le texte est laissé sans traduction (None). Un thread dont la requête ne
+    répond jamais (GoogleTranslator n'a pas de délai réseau) reste occupé : l'attente d'un thread
+    libre est donc elle aussi bornée par `queue_timeout`, et compte comme un dépassement de délai.
+
+    Les refus 429 ne comptent pas dans `retries` : ils ralentissent toutes les requêtes. Un
+    limiteur partagé espace alors les débuts de requête d'au moins Retry-After (intervalle doublé
+    si une requête partie après le ralentissement est encore refusée, réduit à chaque succès).
+    Un texte refusé plus de `rate_limit_retries` fois est abandonné.
+
+    S'utilise avec `async with` (pool de threads ouvert pour la durée du bloc).
+
+    Args:
+        translator: Traducteur distant (translate).
+        cache (TranslationCache, optional): Cache consulté avant le réseau et rempli avec les réponses.
+        local (PhraseTranslator, optional): Traducteur local essayé en premier (translate_strict).
+        concurrency (int, optional): Nombre maximal de requêtes simultanées.
+        timeout (float, optional): Délai maximal d'une tentative, en secondes.
+        queue_timeout (float, optional): Attente maximale d'un thread libre, en secondes. Défaut: timeout.
+        retries (int, optional): Nombre de nouvelles tentatives après un échec.
+        backoff (float, optional): Attente avant la première nouvelle tentative, doublée à chaque échec.
+        max_backoff (float, optional): Attente maximale entre deux tentatives.
+        rate_limit_retries (int, optional): Nombre maximal de refus 429 pour un même texte.
+    """
+
+    def __init__(self, translator, cache=None, local=None, concurrency=8, timeout=30.0, queue_timeout=None, retries=3, backoff=0.5, max_backoff=30.0, rate_limit_retries=100, source='en', target='fr'):
+        self.translator = translator
+        self.cache = cache
+        self.local = local
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limit_retries = rate_limit_retries
+        self.source = source
+        self.target = target
+        # Générateur dédié : l'attente aléatoire ne consomme pas le générateur global du rendu
+        self._jitter = random.Random()
+        self._pending = {}
+        self._semaphore = None
+        self._threads = None
+        # Limiteur partagé : intervalle minimal entre deux débuts de requête, prochain début autorisé
+        # et moment du dernier ralentissement
+        self._interval = 0.0
+        self._next_start = 0.0
+        self._slowed_at = float("-inf")
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._threads = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="translate")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._threads.shutdown(wait=False)
+        self._threads = None
+        self._pending.clear()
+
+    def _delay(self, attempt):
+        # Attente exponentielle avec gigue
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * self._jitter.uniform(0.5, 1.0)
+
+    async def _pace(self):
+        # Réserve le prochain début de requête autorisé par le limiteur et l'attend ; retourne le moment
+        # de la réservation (l'espacement appliqué à la requête est celui de ce moment)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next_start)
+        self._next_start = start + self._interval
+        if start > now:
+            await asyncio.sleep(start - now)
+        return now
+
+    def _slow_down(self, reserved, retry_after):
+        # Refus 429 : plus aucun début avant Retry-After, puis des débuts espacés d'au moins Retry-After.
+        # Les requêtes réservées avant le dernier ralentissement ne doublent pas l'intervalle une nouvelle fois.
+        now = asyncio.get_running_loop().time()
+        delay = min(self.backoff if retry_after is None else retry_after, self.max_backoff)
+        if reserved >= self._slowed_at:
+            # Intervalle d'au moins 10 ms pour qu'un Retry-After nul ralentisse quand même
+            self._interval = min(self.max_backoff, max(delay, self._interval * 2, 0.01))
+            self._slowed_at = now
+        self._next_start = max(self._next_start, now + delay)
+
+    async def _call(self, text):
+        # Le délai maximal ne court qu'à partir du début de la requête dans un thread du pool ; l'attente
+        # de ce thread a son propre délai, car les threads des requêtes abandonnées peuvent ne jamais se libérer
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+
+        def call():
+            loop.call_soon_threadsafe(started.set)
+            return self.translator.translate(text)
+
+        future = loop.run_in_executor(self._threads, call)
+        try:
+            await asyncio.wait_for(started.wait(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Requête pas encore commencée : elle est retirée de la file du pool
+            future.cancel()
+            metrics.incr("translation_queue_timeouts")
+            raise
+        start = time.perf_counter()
+        translation = await asyncio.wait_for(future, self.timeout)
+        metrics.observe("translate_request", time.perf_counter() - start)
+        return translation
+
+    async def _request(self, text):
+        attempt = 0
+        rate_limited = 0
+        while True:
+            reserved = None
+            try:
+                async with self._semaphore:
+                    reserved = await self._pace()
+                    translation = await self._call(text)
+                # Succès : le limiteur se relâche progressivement
+                self._interval *= 0.9
+                return translation
+            except RateLimitError as e:
+                metrics.incr("translation_rate_limited")
+                rate_limited += 1
+                if rate_limited > self.rate_limit_retries:
+                    raise
+                self._slow_down(reserved, e.retry_after)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.incr("translation_timeouts")
+                if attempt == self.retries:
+                    raise
+                delay = self._delay(attempt)
+                attempt += 1
+                metrics.incr("translation_retries")
+                logger.debug(f"Traduction de {text!r} : {type(e).__name__}, nouvelle tentative dans {delay:.2f} s")
+                await asyncio.sleep(delay)
+
+    async def _fetch(self, text):
+        try:
+            translation = await self._request(text)
+        except Exception as e:
+            metrics.incr("translation_remote_failures")
+            logger.warning(f"Traduction de {text!r} impossible ({type(e).__name__}: {e})")
+            return None
+        finally:
+            self._pending.pop(text, None)
+        metrics.incr("translation_calls")
+        if translation is not None and self.cache is not None:
+            self.cache.set(text, translation, self.source, self.target)
+        return translation
+
+    async def translate(self, text):
+        """
+        Traduction de `text` (traducteur local, cache, puis service distant), ou None en cas d'échec.
+        """
+        if self.local is not None:
+            translation = self.local.translate_strict(text)
+            if translation is not None:
+                metrics.incr("translation_local_hits")
+                return translation
+        if self.cache is not None:
+            translation = self.cache.get(text, self.source, self.target)
+            if translation is not None:
+                metrics.incr("translation_cache_hits")
+                return translation
+        task = self._pending.get(text)
+        if task is None:
+            task = self._pending[text] = asyncio.ensure_future(self._fetch(text))
+        return await task
+
+    async def translate_many(self, texts):
+        """
+        Traduit en parallèle les textes distincts non vides de `texts`.
+
+        Returns:
+            dict: Traductions obtenues, par texte (les textes en échec sont absents).
+        """
+        texts = list(dict.fromkeys(text for text in texts if text.strip()))
+        translations = await asyncio.gather(*(self.translate(text) for text in texts))
+        return {text: translation for text, translation in zip(texts, translations) if translation is not None}
+
+
+def iter_pipeline(translator, items, texts_of, render, executor, window=64):
+    """
+    Traduit les textes de chaque élément et le rend dès que ses traductions sont prêtes : les
+    attentes réseau d'un élément sont recouvertes par le rendu des éléments déjà traduits.
+
+    La boucle asyncio tourne dans un thread dédié ; au plus `window` éléments sont en cours
+    (traduction ou rendu) à la fois.
+
+    Args:
+        translator (AsyncTranslator): Traducteur asynchrone (ouvert par iter_pipeline).
+        items (iterable): Éléments à rendre (travaux de build_jobs).
+        texts_of (callable): texts_of(item) -> textes de l'élément à traduire.
+        render (callable): render(item, translations) exécuté dans `executor` (picklable pour un pool de processus).
+        executor (Executor): Pool de rendu (ProcessPoolExecutor, ou ThreadPoolExecutor en série).
+        window (int, optional): Nombre maximal d'éléments en cours.
+
+    Yields:
+        Résultats de render, dans l'ordre où les rendus se terminent.
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(window)
+
+        async def process(item):
+            try:
+                translations = await translator.translate_many(texts_of(item))
+                results.put((True, await loop.run_in_executor(executor, render, item, translations)))
+            except Exception as e:
+                results.put((False, e))
+            finally:
+                slots.release()
+
+        tasks = []
+        async with translator:
+            for item in items:
+                await slots.acquire()
+                if stop.is_set():
+                    break
+                tasks.append(asyncio.ensure_future(process(item)))
+            await asyncio.gather(*tasks)
+
+    def main():
+        try:
+            asyncio.run(run())
+        except BaseException as e:
+            results.put((False, e))
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=main, name="translation-pipeline", daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = results.get()
+            if entry is done:
+                break
+            ok, value = entry
+            if not ok:
+                raise value
+            yield value
+    finally:
+        # Consommateur arrêté avant la fin : plus aucun nouvel élément n'est lancé
+        stop.set()
+        thread.join()
+
+
+def benchmark(texts=200, latency=0.05, rate=100.0, concurrencies=(1, 8, 32)):
+    """
+    Traduit `texts` textes distincts auprès du service simulé (mock_translation_server) pour
+    plusieurs niveaux de concurrence : débit, nouvelles tentatives et refus (429) du service.
+    """
+    from mock_translation_server import MockTranslationServer
+
+    with MockTranslationServer(latency=latency, rate=rate) as server:
+        remote = HttpTranslator(server.url, timeout=5.0)
+        for concurrency in concurrencies:
+            metrics.reset()
+            batch = [f"Item {concurrency}-{i} description" for i in range(texts)]
+
+            async def run():
+                async with AsyncTranslator(remote, concurrency=concurrency, timeout=2.0, retries=6, backoff=0.05) as translator:
+                    return await translator.translate_many(batch)
+
+            start = time.perf_counter()
+            translations = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+            counters = metrics.snapshot()["counters"]
+            print(
+                f"concurrence {concurrency:3d} : {len(translations)}/{texts} textes en {elapsed:6.2f} s "
+                f"({texts / elapsed:7.1f}/s), {counters.get('translation_retries', 0)} nouvelles tentatives, "
+                f"{counters.get('translation_rate_limited', 0)} refus 429"
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,98 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from metrics import logger, metrics
+
+_STOP = object()
+
+
+def write_image(img, path):
+    with metrics.span("save_invoice"):
+        img.save(path, "JPEG")
+    metrics.incr("bytes_written", os.path.getsize(path))
+
+
+def write_json(obj, path):
+    with metrics.span("save_annotations"):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=4)
+    metrics.incr("bytes_written", os.path.getsize(path))
+
+
+class AsyncWriter:
+    """
+    Écrit les factures (encodage JPEG) et leurs annotations en arrière-plan.
+
+    Une file bornée alimente un petit groupe de threads : Pillow libère le GIL pendant l'encodage
+    JPEG, le rendu de la facture suivante continue donc pendant l'écriture. Quand la file est
+    pleine, submit bloque, ce qui limite la mémoire occupée par les images en attente.
+    Les écritures restantes sont terminées par flush(), close() ou à la sortie du processus.
+
+    Args:
+        threads (int, optional): Nombre de threads d'écriture.
+        depth (int, optional): Nombre maximal d'écritures en attente.
+    """
+
+    def __init__(self, threads=2, depth=32):
+        self._queue = queue.Queue(maxsize=depth)
+        self._errors = []
+        self._errors_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+        self._closed = False
+        atexit.register(self.close)
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _STOP:
+                    return
+                func, args, key = task
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Échec de l'écriture de {key}: {e}")
+                    with self._errors_lock:
+                        self._errors.append((key, f"{type(e).__name__}: {e}"))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args, key=None):
+        """
+        Exécute func(*args) sur un thread d'écriture ; `key` identifie la facture en cas d'échec.
+        """
+        self._queue.put((func, args, key))
+
+    def submit_image(self, img, path, key=None):
+        self.submit(write_image, img, path, key=key or os.path.basename(path))
+
+    def submit_json(self, obj, path, key=None):
+        self.submit(write_json, obj, path, key=key or os.path.basename(path))
+
+    def drain_errors(self):
+        """
+        Retourne et oublie les écritures en échec depuis le dernier appel : liste de (clé, erreur).
+        """
+        with self._errors_lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def flush(self):
+        """
+        Attend la fin de toutes les écritures en attente.
+        """
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
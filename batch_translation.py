@@ -0,0 +1,80 @@
+import json
+
+
+class IdentityTranslator:
+    """
+    Traducteur local qui renvoie le texte tel quel.
+    Remplace GoogleTranslator pour les exécutions hors ligne et les benchmarks.
+    """
+
+    def __init__(self, source='en', target='fr'):
+        self.source = source
+        self.target = target
+
+    def translate(self, text, **kwargs):
+        return text
+
+    def translate_batch(self, batch, **kwargs):
+        return list(batch)
+
+
+def iter_annotation_texts(json_paths):
+    """
+    Parcourt les champs texte des annotations FATURA2, avec le même critère que le rendu
+    (un champ est dessiné s'il a un 'text' et une 'bbox').
+
+    Args:
+        json_paths (iterable): Chemins des fichiers JSON d'annotations.
+
+    Yields:
+        str: Texte de chaque champ. Les fichiers absents ou invalides sont ignorés ici,
+        l'erreur sera remontée par le travail de rendu correspondant.
+    """
+    for json_path in json_paths:
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for content in data.values():
+            if isinstance(content, dict) and 'text' in content and 'bbox' in content:
+                yield content['text']
+
+
+def translate_unique(texts, translator, cache, batch_size=100, source='en', target='fr'):
+    """
+    Traduit une seule fois chaque texte distinct absent du cache, par lots, et range
+    les résultats dans le cache pour la phase de rendu.
+
+    Args:
+        texts (iterable): Textes à traduire (doublons autorisés).
+        translator: Objet exposant translate(text) et éventuellement translate_batch(list).
+        cache (TranslationCache): Cache où stocker les traductions.
+        batch_size (int, optional): Nombre de textes par appel à translate_batch.
+
+    Returns:
+        dict: Nombre de textes vus, distincts, traduits et de lots envoyés.
+    """
+    seen = 0
+    unique = {}
+    for text in texts:
+        seen += 1
+        if text.strip():
+            unique.setdefault(text, None)
+    pending = cache.missing(unique, source, target)
+
+    batches = 0
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        if hasattr(translator, 'translate_batch'):
+            results = translator.translate_batch(chunk)
+        else:
+            results = [translator.translate(text) for text in chunk]
+        cache.set_many(
+            [(text, result) for text, result in zip(chunk, results) if result is not None],
+            source,
+            target,
+        )
+        batches += 1
+
+    return {"seen": seen, "unique": len(unique), "translated": len(pending), "batches": batches}
@@ -0,0 +1,216 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+from PIL import Image
+
+import final_invoice_generator as generator
+from batch_translation import IdentityTranslator
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_JSON = os.path.join(ROOT, "FATURA_generator", "template.json")
+TEMPLATE_IMAGE = os.path.join(ROOT, "FATURA_generator", "preview.jpeg")
+
+STAGES = ["json_load", "translation", "field_text", "logo", "table_data", "table_draw", "jpeg_encode", "annotation_write"]
+
+# Versions du générateur de tableau comparables (même interface generate_table_data / draw_table_on_image)
+TABLE_GENERATORS = {
+    "final": "final_table_generator.py",
+    "v1": "final_table_generator-v1.py",
+    "v3": "final_table_generator-v3.py",
+    "v4": "final_table_generator-v4.py",
+}
+
+_table_modules = {}
+
+
+def load_table_generator(name):
+    """
+    Charge la classe TableGenerator d'une version du générateur (les fichiers -vN ne sont pas importables par nom).
+    """
+    if name not in _table_modules:
+        spec = importlib.util.spec_from_file_location(f"table_generator_{name}", os.path.join(ROOT, TABLE_GENERATORS[name]))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _table_modules[name] = module.TableGenerator
+    return _table_modules[name]
+
+
+def make_templates(count, folder, seed=0):
+    """
+    Crée `count` modèles synthétiques de type FATURA à partir de FATURA_generator/template.json
+    (textes et montants variés, même image preview.jpeg). Aucun accès réseau n'est nécessaire.
+
+    Returns:
+        list: Couples (chemin JSON, chemin image).
+    """
+    rng = random.Random(seed)
+    with open(TEMPLATE_JSON, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    paths = []
+    for i in range(count):
+        data = json.loads(json.dumps(base))
+        for key, content in data.items():
+            if isinstance(content, dict) and 'text' in content and key not in ("TITLE", "NOTE"):
+                content['text'] = f"{content['text']} ${rng.randint(1, 999)}.{rng.randint(0, 99):02d}"
+        json_path = os.path.join(folder, f"Template1_Instance{i}.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        paths.append((json_path, TEMPLATE_IMAGE))
+    return paths
+
+
+def render_timed(json_path, template_path, table_generator, output_folder):
+    """
+    Rend une facture comme generate_invoice_from_json en chronométrant chaque étape.
+
+    Returns:
+        dict: Durée de chaque étape en secondes.
+    """
+    timings = {}
+    clock = time.perf_counter
+
+    start = clock()
+    data = generator.load_annotations(json_path)
+    with Image.open(template_path) as template:
+        image_size = template.size
+    timings["json_load"] = clock() - start
+
+    img = Image.new("RGB", image_size, "white")
+    font = generator.get_font(12)
+
+    start = clock()
+    texts = generator.translate_fields(data)
+    timings["translation"] = clock() - start
+
+    start = clock()
+    annotations = generator.draw_fields(img, data, texts, image_size, font)
+    timings["field_text"] = clock() - start
+
+    start = clock()
+    generator.add_logo(img, data, template_path, image_size, annotations)
+    timings["logo"] = clock() - start
+
+    table_bbox = data["TABLE"][0][0]["bbox"]
+    start = clock()
+    table = generator.make_table_generator(table_bbox, table_generator_class=load_table_generator(table_generator))
+    table_data = table.generate_table_data()
+    timings["table_data"] = clock() - start
+
+    start = clock()
+    result = table.draw_table_on_image(img, table_bbox, table_data)
+    # v1 ne renvoie que l'image
+    img = result[0] if isinstance(result, tuple) else result
+    annotations["TABLE"] = {"bbox": table_bbox, "text": table_data}
+    timings["table_draw"] = clock() - start
+
+    output_file = os.path.basename(json_path).replace(".json", ".jpeg")
+    start = clock()
+    generator.save_invoice(img, output_folder, output_file)
+    timings["jpeg_encode"] = clock() - start
+
+    start = clock()
+    generator.save_annotations(annotations, output_folder, output_file)
+    timings["annotation_write"] = clock() - start
+    return timings
+
+
+def _init_worker():
+    # Les versions -v1..v4 lisent INVOICE_DATA relativement au dossier courant
+    os.chdir(ROOT)
+    generator.set_translator(IdentityTranslator())
+    generator.translation_cache.path = None
+
+
+def _run_chunk(args):
+    paths, table_generator, output_folder = args
+    return [render_timed(json_path, template_path, table_generator, output_folder) for json_path, template_path in paths]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def run(paths, workers, table_generator, output_folder):
+    """
+    Rend toutes les factures avec `workers` processus et agrège les durées par étape.
+
+    Returns:
+        dict: Débit (factures/s) et p50/p95/moyenne en millisecondes de chaque étape.
+    """
+    chunks = [(paths[i::workers], table_generator, output_folder) for i in range(workers)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        results = [timings for chunk in executor.map(_run_chunk, chunks) for timings in chunk]
+    elapsed = time.perf_counter() - start
+    stages = {}
+    for stage in STAGES:
+        values = [timings[stage] * 1000 for timings in results]
+        stages[stage] = {
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "mean_ms": sum(values) / len(values),
+        }
+    return {
+        "table_generator": table_generator,
+        "workers": workers,
+        "invoices": len(results),
+        "seconds": elapsed,
+        "invoices_per_sec": len(results) / elapsed,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark par étape du générateur de factures (hors ligne)")
+    parser.add_argument("--invoices", type=int, default=40, help="nombre de factures synthétiques")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="mesurer de 1 à N processus")
+    parser.add_argument("--generators", default="final", help="versions du générateur de tableau, par ex. final,v1,v3,v4")
+    parser.add_argument("--output", default="benchmark_results.json", help="fichier de résultats JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="invoice_bench_")
+    try:
+        paths = make_templates(args.invoices, workdir)
+        output_folder = os.path.join(workdir, "output")
+        # Premier passage non mesuré : polices, corpus et logo chargés dans le processus parent
+        _init_worker()
+        _run_chunk((paths[:1], "final", output_folder))
+
+        results = []
+        worker_counts = sorted({1, args.max_workers} | {w for w in (2, 4, 8, 16, 32) if w < args.max_workers})
+        for name in args.generators.split(","):
+            for workers in worker_counts:
+                result = run(paths, workers, name, output_folder)
+                results.append(result)
+                stages = "  ".join(f"{stage} {values['p50_ms']:.2f}/{values['p95_ms']:.2f}" for stage, values in result["stages"].items())
+                print(f"{name:5s} {workers:2d} processus : {result['invoices_per_sec']:7.1f} factures/s  (p50/p95 ms) {stages}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "cpu_count": os.cpu_count(),
+        "invoices": args.invoices,
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Résultats enregistrés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+from metrics import logger
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Empreinte SHA-1 du contenu d'un fichier, ou None s'il n'existe pas.
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def folder_digest(folder):
+    """
+    Empreinte d'un dossier (corpus, polices) : noms et contenus de tous ses fichiers, triés.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, folder).encode('utf-8'))
+            digest.update((file_digest(path) or "").encode('ascii'))
+    return digest.hexdigest()
+
+
+def inputs_key(inputs):
+    """
+    Clé d'une sortie : empreinte des entrées qui la déterminent (dictionnaire sérialisable en JSON).
+    """
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    Manifeste des sorties déjà générées : pour chaque fichier de sortie, la clé de ses entrées.
+
+    Le fichier est en JSON lines et n'est qu'ajouté : une ligne est écrite quand les fichiers d'une
+    facture sont complètement écrits. Après un arrêt brutal, les factures terminées sont donc connues
+    et une dernière ligne tronquée est ignorée. compact() réécrit le fichier avec la dernière clé
+    de chaque sortie.
+
+    Args:
+        path (str): Fichier du manifeste.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["output"]] = entry["key"]
+                    except (ValueError, KeyError):
+                        continue
+
+    def is_fresh(self, output, key):
+        return self.entries.get(output) == key
+
+    def record(self, output, key):
+        line = json.dumps({"output": output, "key": key}, ensure_ascii=False) + "\n"
+        with self._lock:
+            # Un descripteur par processus : les processus du pool ajoutent leurs lignes au même fichier
+            if self._pid != os.getpid():
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+                self._pid = os.getpid()
+            self._file.write(line)
+            self._file.flush()
+            self.entries[output] = key
+
+    def compact(self):
+        """
+        Relit le manifeste (lignes ajoutées par les autres processus) et le réécrit de façon atomique.
+        """
+        self.close()
+        self.__init__(self.path)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for output, key in self.entries.items():
+                f.write(json.dumps({"output": output, "key": key}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Manifeste {self.path} compacté ({len(self.entries)} sorties)")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
@@ -0,0 +1,103 @@
+import mmap
+import os
+import random
+from array import array
+
+INVOICE_DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "INVOICE_DATA")
+CORPORA = ["table_data", "table_data-2"]
+
+
+class CorpusIndex:
+    """
+    Index en mémoire des corpus de colonnes (INVOICE_DATA/<corpus>/<colonne>.txt).
+
+    Chaque colonne est gardée sous forme d'un bloc d'octets (le contenu du fichier) et de deux
+    tableaux d'offsets de début et de fin de ligne. Chargé avant le fork du pool, l'index est
+    partagé en copie sur écriture par les processus ; avec use_mmap=True les fichiers sont
+    projetés en mémoire et partagés par le cache de pages du système.
+
+    Args:
+        folder (str): Dossier du corpus.
+        use_mmap (bool, optional): Projeter les fichiers en mémoire au lieu de les lire.
+    """
+
+    def __init__(self, folder, use_mmap=False):
+        self.folder = folder
+        self.columns = {}
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith(".txt"):
+                self._load(filename[:-4], os.path.join(folder, filename), use_mmap)
+
+    def _load(self, key, path, use_mmap):
+        with open(path, "rb") as f:
+            if use_mmap and os.fstat(f.fileno()).st_size:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = f.read()
+        starts = array("I")
+        ends = array("I")
+        # Mêmes lignes que file.readlines() : une dernière ligne vide n'est pas comptée
+        position = 0
+        size = len(buffer)
+        while position < size:
+            end = buffer.find(b"\n", position)
+            if end < 0:
+                end = size
+            starts.append(position)
+            ends.append(end)
+            position = end + 1
+        self.columns[key] = (buffer, starts, ends)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def get(self, key, index):
+        buffer, starts, ends = self.columns[key]
+        return buffer[starts[index]:ends[index]].decode("utf-8").strip()
+
+    def pick(self, key, rng=random):
+        """
+        Tire une ligne au hasard dans la colonne `key`, comme random.choice(file.readlines()).strip().
+
+        Returns:
+            str: Ligne tirée, ou None si la colonne n'existe pas ou est vide.
+        """
+        column = self.columns.get(key)
+        if column is None or not column[1]:
+            return None
+        return self.get(key, rng.randrange(len(column[1])))
+
+    def values(self, key):
+        return [self.get(key, i) for i in range(len(self.columns[key][1]))]
+
+    def sizes(self):
+        """
+        Retourne, pour chaque colonne, le nombre de lignes et la taille en octets.
+        """
+        return {
+            key: {"lines": len(starts), "bytes": len(buffer) + starts.itemsize * (len(starts) + len(ends))}
+            for key, (buffer, starts, ends) in self.columns.items()
+        }
+
+
+_corpora = {}
+
+
+def get_corpus(name="table_data", use_mmap=False):
+    """
+    Retourne l'index du corpus `name` (un dossier de INVOICE_DATA ou un chemin), chargé une fois par processus.
+    """
+    folder = os.path.join(INVOICE_DATA_FOLDER, name)
+    if not os.path.isdir(folder):
+        folder = name
+    key = (folder, use_mmap)
+    if key not in _corpora:
+        _corpora[key] = CorpusIndex(folder, use_mmap)
+    return _corpora[key]
+
+
+if __name__ == "__main__":
+    for name in CORPORA:
+        print(name)
+        for key, size in get_corpus(name).sizes().items():
+            print(f"  {key:10s} {size['lines']:5d} lignes {size['bytes']:7d} octets")
@@ -0,0 +1,134 @@
+import re
+import timeit
+
+# Taux de conversion vers l'euro, par code devise
+DEFAULT_RATES = {'USD': 0.85}
+# Symboles reconnus pour chaque code devise
+DEFAULT_SYMBOLS = {'USD': ['$']}
+
+# Montant entier : pas collé à un chiffre ou un point qui précède ("12.345$" n'est pas "345$"),
+# ni suivi d'autres chiffres ("$12.345" n'est pas "$12.34")
+AMOUNT_PATTERN = r'(?<![\d.])\d+(?:\.\d{1,2})?(?!\d|\.\d)'
+
+
+class CurrencyConverter:
+    """
+    Convertit les montants d'un texte en une seule passe avec une expression régulière compilée une fois.
+
+    Reconnaît "$12.50", "$ 12.50", "12.50 USD", "12.50USD", "12.50 $" et "12.50$". Chaque montant
+    n'est converti qu'une fois, même s'il correspond à plusieurs formes.
+
+    Args:
+        rates (dict, optional): Taux par code devise, par ex. {'USD': 0.85}.
+        symbols (dict, optional): Symboles associés à chaque code devise, par ex. {'USD': ['$']}.
+        target_format (str, optional): Format du montant converti. Défaut: "{amount:.2f} €".
+    """
+
+    def __init__(self, rates=None, symbols=None, target_format="{amount:.2f} €"):
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        symbols = DEFAULT_SYMBOLS if symbols is None else symbols
+        self.target_format = target_format
+
+        # Chaque jeton (code ou symbole) pointe vers son taux
+        self._token_rates = {}
+        codes = []
+        prefixes = []
+        for code, rate in self.rates.items():
+            self._token_rates[code] = rate
+            codes.append(code)
+            for symbol in symbols.get(code, []):
+                self._token_rates[symbol] = rate
+                prefixes.append(symbol)
+
+        # Les jetons les plus longs d'abord pour que l'alternation préfère "US$" à "$"
+        def alternation(tokens):
+            return '|'.join(re.escape(t) for t in sorted(set(tokens), key=len, reverse=True))
+
+        parts = []
+        if prefixes:
+            parts.append(rf'(?P<pre>{alternation(prefixes)})\s?(?P<pre_amount>{AMOUNT_PATTERN})')
+        # Un code en lettres est un mot entier ("123USDT" n'est pas un montant en USD)
+        suffixes = [rf'(?:{alternation(codes)})\b'] if codes else []
+        if prefixes:
+            # Un symbole suivi d'un montant appartient au montant suivant ("5 $10" -> "$10")
+            suffixes.append(rf'(?:{alternation(prefixes)})(?!\s?\d)')
+        if suffixes:
+            parts.append(rf'(?P<post_amount>{AMOUNT_PATTERN})\s?(?P<post>{"|".join(suffixes)})')
+        self.pattern = re.compile('|'.join(parts)) if parts else None
+
+    def _replace(self, match):
+        if match.group('pre_amount') is not None:
+            amount, token = match.group('pre_amount'), match.group('pre')
+        else:
+            amount, token = match.group('post_amount'), match.group('post')
+        return self.target_format.format(amount=float(amount) * self._token_rates[token])
+
+    def convert(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._replace, text)
+
+    def convert_many(self, texts):
+        """
+        Convertit une liste de textes avec un seul appel à re.sub sur les textes joints.
+
+        Returns:
+            list: Textes convertis, dans le même ordre.
+        """
+        texts = list(texts)
+        if self.pattern is None or not texts:
+            return texts
+        joined = '\x00'.join(texts)
+        # Le séparateur ne peut faire partie d'aucun montant ; repli texte par texte s'il est déjà présent
+        if joined.count('\x00') != len(texts) - 1:
+            return [self.convert(text) for text in texts]
+        return self.pattern.sub(self._replace, joined).split('\x00')
+
+
+default_converter = CurrencyConverter()
+
+
+def convert_currency(text):
+    return default_converter.convert(text)
+
+
+def _legacy_convert_currency(text):
+    # Ancienne implémentation de translate_data, gardée pour le benchmark
+    pattern_dollar = r'\$\s?(\d+(\.\d{1,2})?)'
+    matches_dollar = re.findall(pattern_dollar, text)
+    for match in matches_dollar:
+        dollar_amount = match[0]
+        euro_amount = float(dollar_amount) * 0.85
+        text = text.replace(f"${dollar_amount}", f"{euro_amount:.2f} €")
+    pattern_usd = r'(\d+(\.\d{1,2})?)\s?USD'
+    matches_usd = re.findall(pattern_usd, text)
+    for match in matches_usd:
+        dollar_amount = match[0]
+        euro_amount = float(dollar_amount) * 0.85
+        text = text.replace(f"{dollar_amount} USD", f"{euro_amount:.2f} €")
+    pattern_dollar_end = r'(\d+(\.\d{1,2})?)\s?\$'
+    matches_dollar_end = re.findall(pattern_dollar_end, text)
+    for match in matches_dollar_end:
+        dollar_amount = match[0]
+        euro_amount = float(dollar_amount) * 0.85
+        text = text.replace(f"{dollar_amount} $", f"{euro_amount:.2f} €")
+    return text
+
+
+def benchmark(number=2000):
+    """
+    Compare l'ancienne conversion et CurrencyConverter sur des champs courts et un champ long.
+    """
+    samples = {
+        "court": ["Total: $57.80", "SUB TOTAL 245.30 USD", "Tax: 12.50 $", "Date: 20-Mar-2008"],
+        "long": [" ".join(f"Item {i} ${i}.99 shipping {i}.50 USD" for i in range(200))],
+    }
+    for name, texts in samples.items():
+        legacy = timeit.timeit(lambda: [_legacy_convert_currency(t) for t in texts], number=number)
+        single = timeit.timeit(lambda: [convert_currency(t) for t in texts], number=number)
+        batch = timeit.timeit(lambda: default_converter.convert_many(texts), number=number)
+        print(f"{name:6s} ancien: {legacy * 1e6 / number:9.1f} µs  une passe: {single * 1e6 / number:9.1f} µs  lot: {batch * 1e6 / number:9.1f} µs")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,21 +1,48 @@
-from final_table_generator import TableGenerator
-import random, os, json
-from PIL import Image, ImageDraw, ImageFont
-import pytesseract
+from final_table_generator import FIT_MODES, TableGenerator, premeasure_corpus
+from table_grid import GRID_STYLES
+import random, os, json, atexit, threading
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image
 from deep_translator import GoogleTranslator
+from translation_cache import TranslationCache
+from corpus_index import get_corpus
+from logo_library import LogoLibrary, logo_position, template_key
+from template_base import BaseLayerCache
+from annotation_index import open_index, JSON_OK, IMAGE_OK
+from metrics import logger, metrics, setup_logging
+from async_writer import AsyncWriter, write_image, write_json
+from output_sinks import CocoAnnotationWriter, JsonlAnnotationSink, TarShardSink, hashed_folder, new_run_id
+from font_registry import FONTS_FOLDER, get_font, text_bbox
+from text_sprites import draw_text
+from build_manifest import BuildManifest, file_digest, folder_digest, inputs_key
+from currency import convert_currency, default_converter
+from batch_translation import iter_annotation_texts, translate_unique
+from phrase_translator import FallbackTranslator, PhraseTranslator
+from async_translation import AsyncTranslator, HttpTranslator, iter_pipeline
+
+# Version du rendu, enregistrée dans le manifeste : à incrémenter quand une modification change les factures produites
+GENERATOR_VERSION = 3
+
+# Logos découpés une fois par modèle et partagés par toutes les factures du processus
+logo_library = LogoLibrary(cache_folder=os.environ.get("LOGO_CACHE"))
 
 # Fonction pour découper et coller le logo
-def add_logo_to_invoice(template_path, logo_bbox, img, image_size):
-    template = Image.open(template_path)
-    x1, y1 = logo_bbox[0]
-    x2, y2 = logo_bbox[1]
-    y1, y2 = template.height - y1, template.height - y2
-    x1, x2 = min(x1, x2), max(x1, x2)
-    y1, y2 = min(y1, y2), max(y1, y2)
-    logo = template.crop((x1, y1, x2, y2))
-    new_y1 = image_size[1] - (template.height - y1)
-    img.paste(logo, (int(x1), int(new_y1)))
-    print(f"Logo ajouté à la position ({x1}, {new_y1})")
+@metrics.timed("logo")
+def add_logo_to_invoice(template_path, logo_bbox, img, image_size, swap=False, rng=random):
+    logo = logo_library.get(template_path, logo_bbox)
+    if swap:
+        logo = logo_library.pick(logo.size, rng) or logo
+    position = logo_position(logo_bbox, image_size)
+    img.paste(logo, position)
+    logger.debug(f"Logo ajouté à la position {position}")
+
+# Pages de base par modèle (fond blanc, logo, champs constants), copiées pour chaque instance
+base_layers = BaseLayerCache(max_bytes=int(os.environ.get("BASE_LAYER_CACHE_MB", 256)) * 1024 * 1024)
+
+# Champs dont le texte est le même pour toutes les instances d'un modèle, dessinés dans la page de base.
+# Le texte fait partie de la clé de la page : un champ qui varie malgré tout reste correct.
+STATIC_FIELDS = ("TITLE",)
 
 def extract_table_bbox_from_json(json_path):
     with open(json_path, 'r') as file:
@@ -23,98 +50,680 @@ def extract_table_bbox_from_json(json_path):
     table_bbox = data["TABLE"][0][0]["bbox"]
     return table_bbox
 
+# Traducteur et cache partagés par toutes les factures d'un même processus
+translation_cache = TranslationCache(os.environ.get("TRANSLATION_CACHE", "translation_cache.sqlite"))
+_translator = None
+# Traducteur local par table de phrases, essayé avant le cache et le traducteur distant (None = désactivé)
+_local_translator = None
+
+def get_translator():
+    global _translator
+    if _translator is None:
+        _translator = GoogleTranslator(source='en', target='fr')
+    return _translator
+
+def set_translator(translator):
+    """
+    Remplace le traducteur du processus (par ex. IdentityTranslator pour un run hors ligne).
+    """
+    global _translator
+    _translator = translator
+
+def set_local_translator(translator):
+    global _local_translator
+    _local_translator = translator
+
+def build_local_translator():
+    """
+    Traducteur local : glossaire des factures et traductions courtes déjà présentes dans translation_cache.
+    """
+    translator = PhraseTranslator('en', 'fr')
+    added = translator.add_cache(translation_cache)
+    logger.info(f"Traducteur local : {translator.size} phrases dont {added} issues du cache")
+    return translator
+
+def _init_worker(translator, cache_path, writer_threads=0, writer_depth=32, output=None, manifest_path=None, local_translator=None, reports=None):
+    set_translator(translator)
+    set_local_translator(local_translator)
+    translation_cache.path = cache_path
+    set_output(**(output or {}))
+    set_manifest(manifest_path)
+    set_writer(writer_threads, writer_depth)
+    # Priorité plus basse que l'écrivain : les archives sont fermées après les dernières écritures
+    multiprocessing.util.Finalize(None, close_sinks, exitpriority=5)
+    if reports is not None:
+        multiprocessing.util.Finalize(None, _report_worker, args=(reports,), exitpriority=1)
+    # Les mesures héritées du processus principal par le fork y sont déjà comptées
+    metrics.reset()
+
+def _report_worker(reports):
+    # Dernier finaliseur d'un processus du pool, après l'écrivain et les archives : les écritures
+    # terminées après le dernier résultat renvoient leurs échecs et leurs mesures au processus principal
+    errors = []
+    if _writer is not None:
+        _writer.close()
+        errors = _writer.drain_errors()
+    close_sinks()
+    reports.put((errors, metrics.drain()))
+
+def _collect_reports(reports, collected):
+    # Lit les rapports des processus pendant leur arrêt (la file ne doit pas se remplir) jusqu'à None
+    for report in iter(reports.get, None):
+        collected.append(report)
+
+def _iter_job_texts(jobs):
+    for job in jobs:
+        if job.get("index_path") is not None:
+            index = open_index(job["index_path"])
+            if (job["template"], job["instance"]) in index:
+                yield from index.texts(job["template"], job["instance"])
+        else:
+            yield from iter_annotation_texts([job["json_file"]])
+
+def pretranslate_jobs(jobs, batch_size=100):
+    """
+    Pré-traduit en lots tous les textes distincts des annotations d'un lot de travaux.
+    Le rendu retrouve ensuite chaque traduction dans translation_cache sans appel réseau.
+
+    Returns:
+        dict: Statistiques de translate_unique, ou None si le traducteur distant a échoué (traducteur local actif).
+    """
+    texts = default_converter.convert_many(_iter_job_texts(jobs))
+    if _local_translator is not None:
+        # Les textes couverts par le traducteur local ne passent ni par le cache ni par le réseau
+        texts = [text for text in texts if _local_translator.translate_strict(text) is None]
+    try:
+        stats = translate_unique(texts, get_translator(), translation_cache, batch_size)
+    except Exception as e:
+        if _local_translator is None:
+            raise
+        logger.warning(f"Pré-traduction impossible ({type(e).__name__}: {e}), traduction texte par texte au rendu")
+        return None
+    metrics.incr("translation_calls", stats["translated"])
+    logger.info(f"Pré-traduction : {stats['unique']} textes distincts sur {stats['seen']}, {stats['translated']} traduits en {stats['batches']} lots")
+    return stats
+
+def job_texts(job):
+    """
+    Textes d'un travail tels qu'ils sont traduits au rendu (montants déjà convertis).
+    """
+    return default_converter.convert_many(_iter_job_texts([job]))
+
+@metrics.timed("translate")
 def translate_data(text):
-    translator = GoogleTranslator(source='en', target='fr')
-    def convert_currency(text):
-        import re
-        pattern_dollar = r'\$\s?(\d+(\.\d{1,2})?)'
-        matches_dollar = re.findall(pattern_dollar, text)
-        for match in matches_dollar:
-            dollar_amount = match[0]
-            euro_amount = float(dollar_amount) * 0.85
-            text = text.replace(f"${dollar_amount}", f"{euro_amount:.2f} €")
-        pattern_usd = r'(\d+(\.\d{1,2})?)\s?USD'
-        matches_usd = re.findall(pattern_usd, text)
-        for match in matches_usd:
-            dollar_amount = match[0]
-            euro_amount = float(dollar_amount) * 0.85
-            text = text.replace(f"{dollar_amount} USD", f"{euro_amount:.2f} €")
-        pattern_dollar_end = r'(\d+(\.\d{1,2})?)\s?\$'
-        matches_dollar_end = re.findall(pattern_dollar_end, text)
-        for match in matches_dollar_end:
-            dollar_amount = match[0]
-            euro_amount = float(dollar_amount) * 0.85
-            text = text.replace(f"{dollar_amount} $", f"{euro_amount:.2f} €")
-        return text
+    # Traducteur local, puis cache, puis traducteur distant (voir FallbackTranslator)
     text = convert_currency(text)
-    translated_text = translator.translate(text)
+    translated_text = FallbackTranslator(_local_translator, translation_cache, get_translator(), 'en', 'fr').translate(text)
+    metrics.incr("translations")
     return translated_text
 
-def generate_invoice_from_json(json_file, template_path, output_folder="output_invoices", image_size=(600, 900), output_file="output_invoice.jpeg", annotations_folder="generated_annotations"):
+# Étapes du rendu d'une facture, appelées dans l'ordre par generate_invoice_from_json (et par benchmark.py)
+def load_annotations(json_file):
     with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    img = Image.new("RGB", image_size, "white")
-    draw = ImageDraw.Draw(img)
-    
-    try:
-        font = ImageFont.truetype("fonts/DejaVuSans.ttf", 12)
-    except IOError:
-        font = ImageFont.load_default()
+        return json.load(f)
+
+def translate_fields(data):
+    return {key: translate_data(content['text']) for key, content in data.items() if 'text' in content and 'bbox' in content}
 
+def draw_fields(img, data, texts, image_size, font, drawn=()):
+    # drawn : champs déjà présents sur la page de base, seulement annotés
     annotations = {}
+    for key, text in texts.items():
+        bbox = data[key]['bbox']
+        x1, y1 = bbox[0]
+        x2, y2 = bbox[1]
+        y1, y2 = image_size[1] - y1, image_size[1] - y2
+        position = (x1, min(y1, y2))
+        if key not in drawn:
+            draw_text(img, position, text, fill="black", font=font)
+        annotations[key] = {"bbox": [x1, y1, x2, y2], "text": text}
+    return annotations
+
+def base_layer(data, texts, template_path, image_size, font, swap_logo=False):
+    """
+    Copie de la page de base du modèle : fond blanc, champs de STATIC_FIELDS et logo (sauf échange de logo).
+
+    Returns:
+        tuple: (image, champs déjà dessinés, rectangle du logo collé ou None).
+    """
+    static = {key: texts[key] for key in STATIC_FIELDS if key in texts}
+    logo_bbox = data["LOGO"]["bbox"] if "LOGO" in data and "bbox" in data["LOGO"] and not swap_logo else None
+    key = (
+        template_key(template_path),
+        tuple(image_size),
+        (getattr(font, "path", None), getattr(font, "size", None)),
+        tuple((name, repr(data[name]['bbox']), text) for name, text in static.items()),
+        repr(logo_bbox),
+    )
 
-    for key, content in data.items():
-        if 'text' in content and 'bbox' in content:
-            text = translate_data(content['text'])
-            bbox = content['bbox']
-            x1, y1 = bbox[0]
-            x2, y2 = bbox[1]
-            y1, y2 = image_size[1] - y1, image_size[1] - y2
-            position = (x1, min(y1, y2))
-            draw.text(position, text, fill="black", font=font)
-            annotations[key] = {"bbox": [x1, y1, x2, y2], "text": text}
+    def build():
+        img = Image.new("RGB", image_size, "white")
+        draw_fields(img, data, static, image_size, font)
+        logo_rect = None
+        if logo_bbox is not None:
+            annotations = {}
+            add_logo(img, data, template_path, image_size, annotations)
+            if "LOGO" in annotations:
+                x, y = logo_position(logo_bbox, image_size)
+                width, height = logo_library.get(template_path, logo_bbox).size
+                logo_rect = (x, y, x + width, y + height)
+        return img, logo_rect
 
+    img, logo_rect = base_layers.get(key, build)
+    return img, tuple(static), logo_rect
+
+def _covers(rect, position, text, font):
+    # Le texte dessiné en `position` touche-t-il le rectangle ?
+    left, top, right, bottom = text_bbox(font, text)
+    x, y = position
+    return x + left < rect[2] and x + right > rect[0] and y + top < rect[3] and y + bottom > rect[1]
+
+def add_logo(img, data, template_path, image_size, annotations, swap_logo=False, rng=random):
     if "LOGO" in data and "bbox" in data["LOGO"]:
         try:
-            add_logo_to_invoice(template_path, data["LOGO"]["bbox"], img, image_size)
+            add_logo_to_invoice(template_path, data["LOGO"]["bbox"], img, image_size, swap_logo, rng)
             annotations["LOGO"] = {"bbox": data["LOGO"]["bbox"], "text": "LOGO"}
         except Exception as e:
-            print(f"Erreur lors de l'ajout du logo: {e}")
+            metrics.incr("logo_failures")
+            logger.warning(f"Erreur lors de l'ajout du logo: {e}")
 
-    table_bbox = extract_table_bbox_from_json(json_file)
+def make_table_generator(table_bbox, corpus="table_data", table_generator_class=TableGenerator, rng=None):
     height = max(table_bbox[0][1], table_bbox[1][1]) - min(table_bbox[0][1], table_bbox[1][1])
     width = max(table_bbox[0][0], table_bbox[1][0]) - min(table_bbox[0][0], table_bbox[1][0])
-    table_generator = TableGenerator(height, width)
-    img, table_data = table_generator.draw_table_on_image(img, table_bbox)
-    annotations["TABLE"] = {"bbox": table_bbox, "text": table_data}
+    if table_generator_class is TableGenerator:
+        return TableGenerator(height, width, corpus, rng)
+    return table_generator_class(height, width)
+
+# Écritures en arrière-plan du processus (None = écritures synchrones)
+_writer = None
+
+def set_writer(threads=2, depth=32):
+    """
+    Active (threads > 0) ou désactive l'écriture asynchrone des factures et annotations pour ce processus.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.close()
+    _writer = AsyncWriter(threads, depth) if threads else None
+    if _writer is not None:
+        # Les processus du pool ne passent pas par atexit : multiprocessing appelle ce finaliseur à leur sortie
+        multiprocessing.util.Finalize(_writer, _writer.close, exitpriority=10)
+    return _writer
+
+# Format de sortie du processus : "files" (un JPEG et un JSON par facture) ou "tar" (archives WebDataset)
+_output = {"mode": "files", "shard_size": 1000, "hashed_dirs": False, "annotations": "json", "run_id": None}
+_sinks = {}
+
+ANNOTATION_FORMATS = ("json", "jsonl", "jsonl.gz", "coco")
+
+def set_output(mode="files", shard_size=1000, hashed_dirs=False, annotations="json", run_id=None):
+    """
+    Choisit le format de sortie pour ce processus.
+
+    Args:
+        mode (str, optional): "files" ou "tar".
+        shard_size (int, optional): Nombre de factures par archive tar.
+        hashed_dirs (bool, optional): En mode "files", répartir les fichiers dans des sous-dossiers hachés.
+        annotations (str, optional): "json" (un fichier par facture), "jsonl", "jsonl.gz" (une ligne par
+            facture dans un fichier par processus) ou "coco" (un fichier COCO par processus).
+        run_id (str, optional): Identifiant de l'exécution repris dans les noms des archives et des
+            fichiers d'annotations (le même pour tous les processus d'un lot). Défaut: un par fichier.
+    """
+    if mode not in ("files", "tar"):
+        raise ValueError(f"Format de sortie inconnu : {mode}")
+    if annotations not in ANNOTATION_FORMATS:
+        raise ValueError(f"Format d'annotations inconnu : {annotations}")
+    close_sinks()
+    _output.update(mode=mode, shard_size=shard_size, hashed_dirs=hashed_dirs, annotations=annotations, run_id=run_id)
+
+def _get_sink(output_folder):
+    sink = _sinks.get(output_folder)
+    if sink is None:
+        sink = _sinks[output_folder] = TarShardSink(output_folder, shard_size=_output["shard_size"], run_id=_output["run_id"])
+    return sink
+
+def _get_annotation_sink(annotations_folder):
+    key = ("annotations", annotations_folder)
+    sink = _sinks.get(key)
+    if sink is None:
+        if _output["annotations"] == "coco":
+            sink = CocoAnnotationWriter(annotations_folder, run_id=_output["run_id"])
+        else:
+            # En mode tar, un fichier JSONL par archive ; sinon un seul fichier pour tout le processus
+            shard_size = _output["shard_size"] if _output["mode"] == "tar" else None
+            sink = JsonlAnnotationSink(annotations_folder, compress=_output["annotations"] == "jsonl.gz", shard_size=shard_size, run_id=_output["run_id"])
+        _sinks[key] = sink
+    return sink
+
+def close_sinks():
+    # Ferme les archives et fichiers d'annotations en cours ; appelé après la fin des écritures asynchrones
+    while _sinks:
+        _sinks.popitem()[1].close()
 
+atexit.register(close_sinks)
+
+# Manifeste des sorties du processus (None = pas de génération incrémentale)
+_manifest = None
+
+def set_manifest(path=None):
+    global _manifest
+    _manifest = BuildManifest(path) if path else None
+    return _manifest
+
+def output_paths(output_folder, annotations_folder, output_file):
+    """
+    Chemins de l'image et de l'annotation d'une facture en mode "files".
+    """
+    if _output["hashed_dirs"]:
+        output_folder = hashed_folder(output_folder, output_file)
+        annotations_folder = hashed_folder(annotations_folder, output_file)
+    return os.path.join(output_folder, output_file), os.path.join(annotations_folder, output_file.replace(".jpeg", ".json"))
+
+def save_invoice(img, output_folder, output_file, background=True):
+    if _output["hashed_dirs"]:
+        output_folder = hashed_folder(output_folder, output_file)
     if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
+        os.makedirs(output_folder, exist_ok=True)
     output_path = os.path.join(output_folder, output_file)
-    img.save(output_path, "JPEG")
-    print(f"Facture générée et enregistrée dans {output_path}")
+    if _writer is not None and background:
+        _writer.submit_image(img, output_path, output_file)
+        return output_path
+    write_image(img, output_path)
+    logger.debug(f"Facture générée et enregistrée dans {output_path}")
+    return output_path
 
+def save_annotations(annotations, annotations_folder, output_file, background=True):
+    if _output["hashed_dirs"]:
+        annotations_folder = hashed_folder(annotations_folder, output_file)
     if not os.path.exists(annotations_folder):
-        os.makedirs(annotations_folder)
-    
+        os.makedirs(annotations_folder, exist_ok=True)
     annotations_path = os.path.join(annotations_folder, output_file.replace(".jpeg", ".json"))
-    with open(annotations_path, 'w', encoding='utf-8') as f:
-        json.dump(annotations, f, ensure_ascii=False, indent=4)
-    print(f"Annotations générées et enregistrées dans {annotations_path}")
-
-def main():
-    for k in range(13, 51):
-        for i in range(200):
-            json_path = f"FATURA2/invoices_dataset_final/Annotations/Original_Format/Template{k}_Instance{i}.json"
-            image_path = f"FATURA2/invoices_dataset_final/images/Template{k}_Instance{i}.jpg"
-            image_size = Image.open(image_path).size
-            output_folder = "generated_invoices"
-            output_file = f"Template{k}_Invoice{i}.jpeg"
-            annotations_folder = "generated_annotations"
-            generate_invoice_from_json(json_path, image_path, output_folder, image_size, output_file, annotations_folder)
+    if _writer is not None and background:
+        _writer.submit_json(annotations, annotations_path, output_file)
+        return annotations_path
+    write_json(annotations, annotations_path)
+    logger.debug(f"Annotations générées et enregistrées dans {annotations_path}")
+    return annotations_path
+
+def stream_annotations(annotations, annotations_folder, image_file, image_size):
+    # image_file : chemin de l'image relatif au dossier des factures (ou clé de l'archive en mode tar)
+    sink = _get_annotation_sink(annotations_folder)
+    if _writer is not None:
+        _writer.submit(sink.write, image_file, image_size, annotations, key=os.path.basename(image_file))
+    else:
+        sink.write(image_file, image_size, annotations)
+
+def _save_recorded(img, annotations, output_folder, annotations_folder, output_file, manifest_key):
+    # L'entrée du manifeste n'est ajoutée qu'une fois l'image et l'annotation écrites
+    save_invoice(img, output_folder, output_file, background=False)
+    save_annotations(annotations, annotations_folder, output_file, background=False)
+    _manifest.record(output_file, manifest_key)
+
+def save_outputs(img, annotations, output_folder, annotations_folder, output_file, manifest_key=None):
+    if manifest_key is not None and _manifest is not None:
+        if _writer is not None:
+            _writer.submit(_save_recorded, img, annotations, output_folder, annotations_folder, output_file, manifest_key, key=output_file)
+        else:
+            _save_recorded(img, annotations, output_folder, annotations_folder, output_file, manifest_key)
+        return
+    if _output["mode"] == "tar":
+        # Clé WebDataset : nom de la facture sans extension, commun à l'image et à l'annotation
+        key = os.path.splitext(output_file)[0]
+        sink = _get_sink(output_folder)
+        if _writer is not None:
+            _writer.submit(sink.write, key, img, annotations, key=output_file)
+        else:
+            sink.write(key, img, annotations)
+        if _output["annotations"] != "json":
+            stream_annotations(annotations, annotations_folder, f"{key}.jpeg", img.size)
+        return
+    output_path = save_invoice(img, output_folder, output_file)
+    if _output["annotations"] == "json":
+        save_annotations(annotations, annotations_folder, output_file)
+    else:
+        stream_annotations(annotations, annotations_folder, os.path.relpath(output_path, output_folder), img.size)
+
+@metrics.timed("invoice")
+def generate_invoice_from_json(json_file, template_path, output_folder="output_invoices", image_size=(600, 900), output_file="output_invoice.jpeg", annotations_folder="generated_annotations", corpus="table_data", swap_logo=False, data=None, rng=None, manifest_key=None, grid_style="full", fit_text="none"):
+    # data : annotations déjà chargées (index binaire), pour ne pas relire le JSON
+    # rng : générateur aléatoire de la facture (job_rng), pour un rendu reproductible
+    if rng is None:
+        rng = random
+    if data is None:
+        data = load_annotations(json_file)
+
+    font = get_font(12)
+
+    texts = translate_fields(data)
+    img, drawn, logo_rect = base_layer(data, texts, template_path, image_size, font, swap_logo)
+    annotations = draw_fields(img, data, texts, image_size, font, drawn)
+    if logo_rect is None:
+        add_logo(img, data, template_path, image_size, annotations, swap_logo, rng)
+    else:
+        annotations["LOGO"] = {"bbox": data["LOGO"]["bbox"], "text": "LOGO"}
+        # Le logo est collé après les textes : on le recolle si un texte variable déborde dessus
+        if any(_covers(logo_rect, (a["bbox"][0], min(a["bbox"][1], a["bbox"][3])), a["text"], font) for key, a in annotations.items() if key not in drawn and key != "LOGO"):
+            add_logo(img, data, template_path, image_size, {})
+
+    table_bbox = data["TABLE"][0][0]["bbox"]
+    table_generator = make_table_generator(table_bbox, corpus, rng=rng)
+    table_data = table_generator.generate_table_data()
+    img, table_data = table_generator.draw_table_on_image(img, table_bbox, table_data, grid_style=grid_style, fit=fit_text)
+    annotations["TABLE"] = {"bbox": table_bbox, "text": table_data}
+
+    save_outputs(img, annotations, output_folder, annotations_folder, output_file, manifest_key)
+
+def job_rng(seed, template, instance):
+    """
+    Générateur aléatoire d'une facture, dérivé de (graine globale, modèle, instance).
+    Une même facture reçoit les mêmes tirages quels que soient le nombre de processus et l'ordre
+    d'exécution : elle peut être régénérée seule.
+    """
+    # Une graine str est hachée en SHA-512 par random : stable entre processus et exécutions
+    return random.Random(f"{seed}:{template}:{instance}")
+
+def build_jobs(templates=range(13, 51), instances=range(200), dataset_folder="FATURA2/invoices_dataset_final", output_folder="generated_invoices", annotations_folder="generated_annotations", corpus="table_data", index_path=None, seed=None, grid_style="full", fit_text="none"):
+    """
+    Construit la liste ordonnée des travaux (un par facture) à générer.
+    Avec index_path, les annotations et tailles d'images sont lues dans l'index binaire (annotation_index.py).
+    Sans seed, une graine est tirée et affichée pour pouvoir reproduire le lot.
+
+    Returns:
+        list: Dictionnaires d'arguments pour generate_invoice_from_json.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+        logger.info(f"Graine du lot : {seed}")
+    jobs = []
+    for k in templates:
+        for i in instances:
+            jobs.append({
+                "json_file": f"{dataset_folder}/Annotations/Original_Format/Template{k}_Instance{i}.json",
+                "template_path": f"{dataset_folder}/images/Template{k}_Instance{i}.jpg",
+                "output_folder": output_folder,
+                "output_file": f"Template{k}_Invoice{i}.jpeg",
+                "annotations_folder": annotations_folder,
+                "corpus": corpus,
+                "template": k,
+                "instance": i,
+                "index_path": index_path,
+                "seed": seed,
+                "grid_style": grid_style,
+                "fit_text": fit_text,
+            })
+    return jobs
+
+def translation_identity():
+    """
+    Source des traductions : traducteur distant (classe, langues, adresse du service) et traducteur local.
+    Une facture traduite hors ligne n'est pas à jour pour une exécution en ligne, et inversement.
+    """
+    translator = get_translator()
+    return {
+        "remote": type(translator).__name__,
+        "source": getattr(translator, "source", None),
+        "target": getattr(translator, "target", None),
+        "url": getattr(translator, "url", None),
+        "local": type(_local_translator).__name__ if _local_translator is not None else None,
+    }
+
+def job_inputs_key(job, digests):
+    """
+    Clé des entrées d'un travail : annotation, image du modèle, corpus, polices, source des traductions,
+    graine et version du générateur.
+
+    Args:
+        job (dict): Travail produit par build_jobs.
+        digests (dict): Empreintes déjà calculées des dossiers (corpus, polices), complétées au besoin.
+    """
+    corpus = job.get("corpus", "table_data")
+    if corpus not in digests:
+        digests[corpus] = folder_digest(get_corpus(corpus).folder)
+    if "fonts" not in digests:
+        digests["fonts"] = folder_digest(FONTS_FOLDER)
+    if "translation" not in digests:
+        digests["translation"] = translation_identity()
+    if job.get("index_path") is not None:
+        index = open_index(job["index_path"])
+        key = (job["template"], job["instance"])
+        annotation = inputs_key(index.record(*key)[:2]) if key in index else None
+    else:
+        annotation = file_digest(job["json_file"])
+    return inputs_key({
+        "job": {name: value for name, value in job.items() if name != "index_path"},
+        "annotation": annotation,
+        "template_image": file_digest(job["template_path"]),
+        "corpus": digests[corpus],
+        "fonts": digests["fonts"],
+        "translation": digests["translation"],
+        "version": GENERATOR_VERSION,
+    })
+
+def stale_jobs(jobs, manifest):
+    """
+    Garde les travaux dont la sortie manque ou dont les entrées ont changé depuis la dernière génération,
+    et leur ajoute leur clé ("manifest_key") pour l'enregistrer une fois la facture écrite.
+    """
+    digests = {}
+    stale = []
+    for job in jobs:
+        key = job_inputs_key(job, digests)
+        paths = output_paths(job["output_folder"], job["annotations_folder"], job["output_file"])
+        if manifest.is_fresh(job["output_file"], key) and all(os.path.exists(path) for path in paths):
+            continue
+        stale.append(dict(job, manifest_key=key))
+    return stale
+
+def register_logos(jobs):
+    """
+    Inscrit le logo de chaque modèle des travaux dans logo_library, avant le fork : l'échange de
+    logos tire dans cet ensemble fixe, identique dans tous les processus quel que soit leur lot.
+    """
+    templates = set()
+    for job in jobs:
+        # Un logo par modèle : ses instances partagent le même logo
+        if template_key(job["template_path"]) in templates:
+            continue
+        try:
+            if job.get("index_path") is not None:
+                data = open_index(job["index_path"]).record(job["template"], job["instance"])[0]
+            else:
+                data = load_annotations(job["json_file"])
+        except (OSError, ValueError, KeyError):
+            continue
+        if "LOGO" in data and "bbox" in data["LOGO"]:
+            logo_library.register(job["template_path"], data["LOGO"]["bbox"])
+            templates.add(template_key(job["template_path"]))
+
+def _run_job(job):
+    # Exécuté dans un processus du pool : une erreur ne doit pas arrêter le lot
+    try:
+        job = dict(job)
+        template, instance, index_path = job.pop("template", None), job.pop("instance", None), job.pop("index_path", None)
+        seed = job.pop("seed", None)
+        if seed is not None:
+            job["rng"] = job_rng(seed, template, instance)
+        if index_path is not None:
+            data, image_size, flags = open_index(index_path).record(template, instance)
+            if flags & (JSON_OK | IMAGE_OK) != JSON_OK | IMAGE_OK:
+                raise ValueError(f"annotation ou image invalide dans l'index (indicateurs {flags})")
+            job.update(data=data, image_size=image_size)
+        elif not job.get("image_size"):
+            with Image.open(job["template_path"]) as template_image:
+                job["image_size"] = template_image.size
+        generate_invoice_from_json(**job)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    # Les écritures asynchrones en échec sont signalées avec le résultat d'un travail suivant
+    write_errors = _writer.drain_errors() if _writer is not None else []
+    return job["output_file"], error, metrics.drain(), write_errors
+
+def _run_translated_job(job, translations):
+    # Traductions obtenues par le pipeline asynchrone : le rendu les retrouve dans le cache en mémoire
+    translation_cache.prime(translations.items())
+    return _run_job(job)
+
+def export_metrics(metrics_jsonl=None, metrics_prom=None):
+    if metrics_jsonl:
+        metrics.write_jsonl(metrics_jsonl)
+    if metrics_prom:
+        metrics.write_prometheus(metrics_prom)
+
+def generate_batch(jobs, workers=None, chunksize=4, pretranslate=True, metrics_jsonl=None, metrics_prom=None, export_every=100, writer_threads=2, writer_depth=32, output_mode="files", shard_size=1000, hashed_dirs=False, annotation_format="json", manifest_path=None, translation_concurrency=None, translation_timeout=30.0, translation_retries=3):
+    """
+    Génère un lot de factures en parallèle sur un pool de processus.
+
+    Args:
+        jobs (list): Travaux produits par build_jobs.
+        workers (int, optional): Nombre de processus. Défaut: nombre de cœurs. 1 = mode série.
+        chunksize (int, optional): Nombre de travaux envoyés à la fois à un processus.
+        pretranslate (bool, optional): Traduire tous les textes distincts en lots avant le rendu.
+        metrics_jsonl (str, optional): Fichier JSON lines où ajouter les mesures.
+        metrics_prom (str, optional): Fichier textfile Prometheus à mettre à jour.
+        export_every (int, optional): Exporter les mesures toutes les N factures.
+        writer_threads (int, optional): Threads d'écriture asynchrone par processus. 0 = écritures synchrones.
+        writer_depth (int, optional): Nombre maximal d'écritures en attente par processus.
+        output_mode (str, optional): "files" (un JPEG et un JSON par facture) ou "tar" (archives de shard_size factures).
+        hashed_dirs (bool, optional): En mode "files", répartir les fichiers dans des sous-dossiers hachés.
+        annotation_format (str, optional): "json", "jsonl", "jsonl.gz" ou "coco" (voir set_output).
+        manifest_path (str, optional): Manifeste de génération incrémentale : seules les factures absentes
+            ou dont les entrées ont changé sont générées, ce qui permet aussi de reprendre un lot interrompu.
+        translation_concurrency (int, optional): Remplace la pré-traduction par un pipeline asyncio :
+            jusqu'à N requêtes de traduction simultanées, et chaque facture est rendue dès que ses textes
+            sont traduits. Les résultats arrivent alors dans l'ordre de fin des rendus.
+        translation_timeout (float, optional): Délai maximal d'une requête de traduction du pipeline, en secondes.
+        translation_retries (int, optional): Nouvelles tentatives d'une requête en échec (attente exponentielle).
+
+    Returns:
+        list: Couples (fichier, erreur) des travaux en échec.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Un identifiant par lot dans les noms de fichiers : un lot suivant dans le même dossier ne touche pas à ceux-ci
+    output = {"mode": output_mode, "shard_size": shard_size, "hashed_dirs": hashed_dirs, "annotations": annotation_format, "run_id": new_run_id()}
+    manifest = set_manifest(manifest_path)
+    if manifest is not None:
+        # Une facture des archives tar ou des fichiers JSONL / COCO ne peut pas être remplacée seule
+        if output_mode != "files" or annotation_format != "json":
+            raise ValueError("La génération incrémentale nécessite output_mode='files' et annotation_format='json'")
+        set_output(**output)
+        total_jobs = len(jobs)
+        jobs = stale_jobs(jobs, manifest)
+        logger.info(f"Génération incrémentale : {len(jobs)} factures à régénérer, {total_jobs - len(jobs)} à jour")
+    pipeline = pretranslate and translation_concurrency is not None
+    if pretranslate and not pipeline:
+        pretranslate_jobs(jobs)
+    # Chargé avant le fork pour être partagé en copie sur écriture par les processus
+    if any(job.get("swap_logo") for job in jobs):
+        register_logos(jobs)
+    for corpus in {job.get("corpus", "table_data") for job in jobs}:
+        get_corpus(corpus)
+        premeasure_corpus(corpus)
+    failures = []
+    worker_reports = []
+    total = len(jobs)
+    if workers == 1:
+        set_output(**output)
+        set_writer(writer_threads, writer_depth)
+        # En série avec le pipeline, le rendu tourne dans un thread pendant que la boucle asyncio traduit
+        executor = ThreadPoolExecutor(max_workers=1) if pipeline else None
+    else:
+        reports = multiprocessing.Queue()
+        reader = threading.Thread(target=_collect_reports, args=(reports, worker_reports), daemon=True)
+        reader.start()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(get_translator(), translation_cache.path, writer_threads, writer_depth, output, manifest_path, _local_translator, reports))
+    if pipeline:
+        translator = AsyncTranslator(get_translator(), translation_cache, _local_translator, concurrency=translation_concurrency, timeout=translation_timeout, retries=translation_retries)
+        results = iter_pipeline(translator, jobs, job_texts, _run_translated_job, executor, window=max(2 * translation_concurrency, 4 * workers))
+    elif executor is None:
+        results = map(_run_job, jobs)
+    else:
+        results = executor.map(_run_job, jobs, chunksize=chunksize)
+    try:
+        # map() rend les résultats dans l'ordre des travaux, le pipeline dans l'ordre de fin des rendus
+        for n, (output_file, error, job_metrics, write_errors) in enumerate(results, 1):
+            metrics.merge(job_metrics)
+            for failed_file, write_error in write_errors:
+                metrics.incr("failures")
+                failures.append((failed_file, write_error))
+                logger.error(f"ÉCHEC de l'écriture de {failed_file}: {write_error}")
+            if error is None:
+                metrics.incr("invoices_done")
+                logger.info(f"[{n}/{total}] {output_file}")
+            else:
+                metrics.incr("failures")
+                failures.append((output_file, error))
+                logger.error(f"[{n}/{total}] ÉCHEC {output_file}: {error}")
+            if n % export_every == 0:
+                export_metrics(metrics_jsonl, metrics_prom)
+    finally:
+        if pipeline:
+            # Arrête le pipeline (lot interrompu) avant le pool de rendu qu'il alimente
+            results.close()
+        # Attend la fin des écritures en attente (les processus du pool les terminent en sortant)
+        if executor is not None:
+            executor.shutdown()
+        if workers > 1:
+            reports.put(None)
+            reader.join()
+            for write_errors, worker_metrics in worker_reports:
+                metrics.merge(worker_metrics)
+                for failed_file, write_error in write_errors:
+                    metrics.incr("failures")
+                    failures.append((failed_file, write_error))
+                    logger.error(f"ÉCHEC de l'écriture de {failed_file}: {write_error}")
+        if workers == 1 and _writer is not None:
+            _writer.flush()
+            for failed_file, write_error in _writer.drain_errors():
+                metrics.incr("failures")
+                failures.append((failed_file, write_error))
+            set_writer(0)
+        close_sinks()
+        if manifest is not None:
+            manifest.compact()
+        export_metrics(metrics_jsonl, metrics_prom)
+    logger.info(f"{total - len(failures)}/{total} factures générées, {len(failures)} échecs")
+    return failures
+
+def main(workers=None, offline=False, corpus="table_data", index_path=None, metrics_jsonl=None, metrics_prom=None, writer_threads=2, output_mode="files", shard_size=1000, hashed_dirs=False, annotation_format="json", seed=None, manifest_path=None, grid_style="full", fit_text="none", local_translation=False, translate_url=None, translation_concurrency=None):
+    if translate_url is not None:
+        set_translator(HttpTranslator(translate_url))
+    if offline or local_translation:
+        set_local_translator(build_local_translator())
+    if offline:
+        # Sans réseau, le traducteur local remplace aussi le traducteur distant ; ses traductions
+        # partielles ne sont pas écrites dans le cache disque pour ne pas le polluer
+        set_translator(_local_translator)
+        translation_cache.path = None
+    if manifest_path is not None and seed is None:
+        # Une graine tirée au hasard rendrait toutes les factures obsolètes à chaque exécution
+        seed = 0
+        logger.info("Génération incrémentale sans --seed : graine 0")
+    return generate_batch(build_jobs(corpus=corpus, index_path=index_path, seed=seed, grid_style=grid_style, fit_text=fit_text), workers=workers, metrics_jsonl=metrics_jsonl, metrics_prom=metrics_prom, writer_threads=writer_threads, output_mode=output_mode, shard_size=shard_size, hashed_dirs=hashed_dirs, annotation_format=annotation_format, manifest_path=manifest_path, translation_concurrency=translation_concurrency)
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Génère les factures FATURA2 traduites")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus (défaut: nombre de cœurs)")
+    parser.add_argument("--offline", action="store_true", help="traduire sans réseau (table de phrases locale et cache)")
+    parser.add_argument("--local-translation", action="store_true", help="essayer la table de phrases locale avant le cache et le traducteur distant")
+    parser.add_argument("--translate-url", default=None, help="service de traduction compatible LibreTranslate à utiliser au lieu de Google Translate")
+    parser.add_argument("--translation-concurrency", type=int, default=None, help="traduire avec N requêtes simultanées pendant le rendu au lieu de tout pré-traduire")
+    parser.add_argument("--corpus", default="table_data", help="corpus des cellules du tableau (table_data, table_data-2)")
+    parser.add_argument("--index", default=None, help="index binaire des annotations (python annotation_index.py)")
+    parser.add_argument("--log-level", default="INFO", help="niveau des journaux (DEBUG, INFO, WARNING, ERROR, off)")
+    parser.add_argument("--metrics-jsonl", default=None, help="fichier JSON lines des mesures")
+    parser.add_argument("--metrics-prom", default=None, help="fichier textfile Prometheus des mesures")
+    parser.add_argument("--writer-threads", type=int, default=2, help="threads d'écriture asynchrone par processus (0 = synchrone)")
+    parser.add_argument("--output-mode", choices=["files", "tar"], default="files", help="fichiers séparés ou archives tar WebDataset")
+    parser.add_argument("--shard-size", type=int, default=1000, help="nombre de factures par archive tar")
+    parser.add_argument("--hashed-dirs", action="store_true", help="répartir les fichiers séparés dans des sous-dossiers hachés")
+    parser.add_argument("--annotations-format", choices=list(ANNOTATION_FORMATS), default="json", help="un JSON par facture, JSON lines (compressé ou non) ou COCO par processus")
+    parser.add_argument("--seed", type=int, default=None, help="graine globale (défaut: tirée au hasard et affichée)")
+    parser.add_argument("--manifest", default=None, help="manifeste de génération incrémentale : ne régénère que les factures obsolètes")
+    parser.add_argument("--grid-style", choices=list(GRID_STYLES), default="full", help="traits du tableau : grille complète, cadre seul ou cadre et trait sous l'en-tête")
+    parser.add_argument("--fit-text", choices=list(FIT_MODES), default="none", help="texte trop large pour sa cellule : réduire la police, tronquer (…) ou revenir à la ligne")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    main(workers=args.workers, offline=args.offline, corpus=args.corpus, index_path=args.index, metrics_jsonl=args.metrics_jsonl, metrics_prom=args.metrics_prom, writer_threads=args.writer_threads, output_mode=args.output_mode, shard_size=args.shard_size, hashed_dirs=args.hashed_dirs, annotation_format=args.annotations_format, seed=args.seed, manifest_path=args.manifest, grid_style=args.grid_style, fit_text=args.fit_text, local_translation=args.local_translation, translate_url=args.translate_url, translation_concurrency=args.translation_concurrency)
     
\ No newline at end of file
@@ -1,55 +1,222 @@
 import random
-import os
-from PIL import Image, ImageDraw, ImageFont
+import unicodedata
+from corpus_index import get_corpus
+from metrics import logger, metrics
+from font_registry import get_font, measure_many, premeasure, text_length, text_size
+from text_sprites import draw_text
+from table_grid import cell_edges, draw_grid
+
+# Dispositions d'en-têtes possibles pour un tableau
+HEADER_LAYOUTS = [
+    ['produit', 'quantité', 'prix'],
+    ['produit', 'prix', 'quantité', 'total'],
+    ['produit', 'quantité', 'prix', 'tax', 'total'],
+    ['qte', 'Description', 'prix unitaire', 'total'],
+    ['description', 'qte', 'prix net', 'prix coutant', 'TVA(%)']
+]
+
+# Colonne du corpus (nom du fichier .txt) pour chaque en-tête
+SYNONYMES = {
+    'produit': ['produit', 'description', 'article', 'code article'],
+    'quantite': ['quantité', 'qte', 'Quantité commandée', 'Quantité livrée'],
+    'prix': ['prix', 'prix unitaire', 'prix net', 'prix coutant'],
+    'total': ['total', 'montant'],
+    'tax': ['tax', 'TVA(%)', 'tva'],
+    'ID': ['ID', 'No', 'Référence']
+}
+
+def _normalize_header(header):
+    # Minuscules, sans accents ni espaces multiples : "Quantité  Livrée" -> "quantite livree"
+    header = unicodedata.normalize('NFKD', header)
+    header = ''.join(c for c in header if not unicodedata.combining(c))
+    return ' '.join(header.lower().split())
+
+def resolve_header(header, synonymes=SYNONYMES, columns=()):
+    """
+    Retourne la colonne du corpus d'un en-tête : correspondance exacte avec un synonyme,
+    puis correspondance normalisée, puis nom de colonne du corpus.
+
+    Returns:
+        str: Clé de colonne, ou None si l'en-tête est inconnu.
+    """
+    for key, synonyms in synonymes.items():
+        if header in synonyms:
+            return key
+    normalized = _normalize_header(header)
+    for key, synonyms in synonymes.items():
+        if any(_normalize_header(synonym) == normalized for synonym in synonyms):
+            return key
+    for key in columns:
+        if _normalize_header(key) == normalized:
+            return key
+    return None
+
+def compile_column_plans(corpus, layouts=HEADER_LAYOUTS, synonymes=SYNONYMES):
+    """
+    Résout une fois pour toutes les colonnes du corpus de chaque disposition d'en-têtes.
+
+    Args:
+        corpus (CorpusIndex): Corpus des cellules.
+
+    Returns:
+        dict: Disposition (tuple d'en-têtes) -> tuple de clés de colonnes (None pour un en-tête inconnu).
+        Les en-têtes inconnus ou sans fichier dans le corpus sont signalés ici plutôt qu'au rendu.
+    """
+    plans = {}
+    for layout in layouts:
+        plan = tuple(resolve_header(header, synonymes, corpus.columns) for header in layout)
+        for header, key in zip(layout, plan):
+            if key is None:
+                logger.warning(f"Attention : en-tête '{header}' sans colonne correspondante, cellules 'Cellule {header}'")
+            elif key not in corpus:
+                logger.warning(f"Attention : colonne '{key}' (en-tête '{header}') absente du corpus {corpus.folder}")
+        plans[tuple(layout)] = tuple(key if key in corpus else None for key in plan)
+    return plans
+
+_column_plans = {}
+
+def get_column_plans(corpus):
+    if corpus.folder not in _column_plans:
+        _column_plans[corpus.folder] = compile_column_plans(corpus)
+    return _column_plans[corpus.folder]
+
+def premeasure_corpus(corpus="table_data", font_size=12):
+    """
+    Mesure d'avance tous les textes possibles des cellules : en-têtes (et leurs majuscules),
+    cellules de repli et lignes du corpus.
+
+    Returns:
+        int: Nombre de textes distincts mesurés.
+    """
+    corpus = get_corpus(corpus)
+    texts = []
+    for layout in HEADER_LAYOUTS:
+        for header in layout:
+            texts.extend((header, header.upper(), f'Cellule {header}'))
+    for key in corpus.columns:
+        texts.extend(corpus.values(key))
+    return premeasure(get_font(font_size), texts)
+
+# Ajustement du texte trop large pour sa cellule : aucun, taille de police réduite, points de suspension ou retour à la ligne
+FIT_MODES = ("none", "shrink", "ellipsis", "wrap")
+MIN_FONT_SIZE = 6
+ELLIPSIS = "…"
+
+def _largest(lo, hi, fits):
+    # Plus grande valeur de [lo, hi] pour laquelle fits est vrai (fits décroissant), ou None
+    best = None
+    while lo <= hi:
+        middle = (lo + hi) // 2
+        if fits(middle):
+            best, lo = middle, middle + 1
+        else:
+            hi = middle - 1
+    return best
+
+def _ellipsize(text, font, max_width):
+    # Plus long préfixe suivi de "…" qui tient dans la largeur
+    k = _largest(0, len(text) - 1, lambda k: text_length(font, text[:k].rstrip() + ELLIPSIS) <= max_width)
+    return text[:k].rstrip() + ELLIPSIS if k is not None else ""
+
+def _wrap(text, font, max_width):
+    lines = []
+    for word in text.split():
+        if lines and text_length(font, f"{lines[-1]} {word}") <= max_width:
+            lines[-1] = f"{lines[-1]} {word}"
+        else:
+            lines.append(word)
+    return "\n".join(lines)
+
+def fit_text(text, font_size, max_width, max_height, fit="shrink", min_size=MIN_FONT_SIZE):
+    """
+    Adapte le texte d'une cellule à sa taille intérieure, par recherche dichotomique sur les
+    largeurs d'avance en cache (font_registry.text_length) : aucun texte n'est rendu.
+
+    Args:
+        text (str): Texte de la cellule.
+        font_size (int): Taille de police normale.
+        max_width (float): Largeur disponible.
+        max_height (float): Hauteur disponible.
+        fit (str, optional): "shrink" (plus grande taille entre min_size et font_size qui tient,
+            puis points de suspension), "ellipsis" (texte tronqué), "wrap" (retours à la ligne,
+            puis points de suspension si les lignes dépassent la hauteur) ou "none".
+        min_size (int, optional): Plus petite taille de police autorisée par "shrink".
+
+    Returns:
+        tuple: (texte à dessiner, police).
+    """
+    if fit not in FIT_MODES:
+        raise ValueError(f"Mode d'ajustement inconnu : {fit}")
+    font = get_font(font_size)
+
+    def fits(font, text):
+        return text_length(font, text) <= max_width and text_size(font, text)[1] <= max_height
+
+    if fit == "none" or fits(font, text):
+        return text, font
+    if fit == "shrink":
+        size = _largest(min_size, font_size - 1, lambda size: fits(get_font(size), text))
+        if size is not None:
+            return text, get_font(size)
+        font = get_font(min_size)
+    elif fit == "wrap":
+        wrapped = _wrap(text, font, max_width)
+        if all(text_length(font, line) <= max_width for line in wrapped.split("\n")) and text_size(font, wrapped)[1] <= max_height:
+            return wrapped, font
+    return _ellipsize(text, font, max_width), font
+
+def layout_cells(table_data, font_size, x1, y1, cell_width, cell_height, fit="none", padding=0):
+    """
+    Position du texte centré de chaque cellule, calculée d'un bloc à partir des mesures en cache.
+
+    Args:
+        fit (str, optional): Ajustement des textes trop grands (voir fit_text).
+        padding (float, optional): Marge intérieure de chaque côté de la cellule pour l'ajustement.
+
+    Returns:
+        list: Quadruplets (texte, x, y, police), ligne par ligne.
+    """
+    cols = len(table_data[0])
+    texts = [str(cell_text) for row in table_data for cell_text in row]
+    if fit == "none":
+        font = get_font(font_size)
+        fitted = [(text, font) for text in texts]
+        # Une seule police : toutes les mesures d'un coup
+        sizes = measure_many(font, texts)
+    else:
+        fitted = [fit_text(text, font_size, cell_width - 2 * padding, cell_height - 2 * padding, fit) for text in texts]
+        sizes = [text_size(font, text) for text, font in fitted]
+    cells = []
+    for n, ((text, font), (text_width, text_height)) in enumerate(zip(fitted, sizes)):
+        i, j = divmod(n, cols)
+        cells.append((text, x1 + j * cell_width + (cell_width - text_width) / 2, y1 + i * cell_height + (cell_height - text_height) / 2, font))
+    return cells
 
 class TableGenerator:
-    def __init__(self, height, width):
+    def __init__(self, height, width, corpus="table_data", rng=None):
         self.height = height
         self.width = width
+        # Générateur aléatoire propre à la facture (voir job_rng) ; par défaut le module random
+        self.rng = rng if rng is not None else random
+        self.corpus = get_corpus(corpus)
         self.en_tetes = self._select_random_headers()
-        self.synonymes = {
-            'produit': ['produit', 'description', 'article', 'code article'],
-            'quantite': ['quantité', 'qte', 'Quantité commandée', 'Quantité livrée'],
-            'prix': ['prix', 'prix unitaire', 'prix net', 'prix coutant'],
-            'total': ['total', 'montant'],
-            'tax': ['tax', 'TVA(%)', 'tva'],
-            'ID': ['ID', 'No', 'Référence']
-        }
+        self.synonymes = SYNONYMES
+        self.colonnes = get_column_plans(self.corpus)[tuple(self.en_tetes)]
     
     def _select_random_headers(self):
-        headers = [
-            ['produit', 'quantité', 'prix'],
-            ['produit', 'prix', 'quantité', 'total'],
-            ['produit', 'quantité', 'prix', 'tax', 'total'],
-            ['qte', 'Description', 'prix unitaire', 'total'],
-            ['description', 'qte', 'prix net', 'prix coutant', 'TVA(%)']
-        ]
-        return random.choice(headers)
-    
-    def _get_file_for_header(self, header):
-        for key, synonyms in self.synonymes.items():
-            for synonym in synonyms:
-                if header.lower() in synonym.lower():
-                    return key
-        return header.lower()
+        return list(self.rng.choice(HEADER_LAYOUTS))
     
     def _generate_random_row(self):
         row = []
-        for header in self.en_tetes:
-            file_key = self._get_file_for_header(header)
-            file_path = f'INVOICE_DATA/table_data/{file_key}.txt'
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    data = file.readlines()
-                row.append(random.choice(data).strip())
-            else:
-                row.append(f'Cellule {header}')
+        for header, file_key in zip(self.en_tetes, self.colonnes):
+            value = self.corpus.pick(file_key, self.rng) if file_key is not None else None
+            row.append(value if value is not None else f'Cellule {header}')
         return row
     
     def generate_table_data(self):
         min_height = 20
         max_lignes = max(3, self.height // min_height)
-        nombre_lignes = random.randint(2, max_lignes)
+        nombre_lignes = self.rng.randint(2, max_lignes)
 
         data = []
         data.append(self.en_tetes)
@@ -60,11 +227,12 @@ class TableGenerator:
 
         return data
     
-    def draw_table_on_image(self, img, table_bbox, table_data=None, output_folder="output_invoices", font_size=12, border_width=2):
+    @metrics.timed("table_draw")
+    def draw_table_on_image(self, img, table_bbox, table_data=None, output_folder="output_invoices", font_size=12, border_width=2, grid_style="full", fit="none"):
         if table_data is None:
             table_data = self.generate_table_data()
         
-        var_1 = random.randint(1, 5)
+        var_1 = self.rng.randint(1, 5)
         if var_1 < 3:
             en_tetes_majuscules = [header.upper() for header in self.en_tetes]
             self.en_tetes = en_tetes_majuscules
@@ -76,13 +244,6 @@ class TableGenerator:
         if not all(len(row) == cols for row in table_data):
             raise ValueError("Toutes les lignes doivent avoir le même nombre de colonnes")
         
-        draw = ImageDraw.Draw(img)
-        
-        try:
-            font = ImageFont.truetype("fonts/DejaVuSans.ttf", font_size)
-        except IOError:
-            font = ImageFont.load_default()
-        
         (x1, y1), (x2, y2) = table_bbox
         
         y1, y2 = img.height - y1, img.height - y2
@@ -97,25 +258,16 @@ class TableGenerator:
         cell_width = width / cols
         cell_height = height / rows
         
-        for i, row in enumerate(table_data):
-            for j, cell_text in enumerate(row):
-                cell_x1 = x1 + j * cell_width
-                cell_y1 = y1 + i * cell_height
-                cell_x2 = cell_x1 + cell_width
-                cell_y2 = cell_y1 + cell_height
-                
-                draw.rectangle([cell_x1, cell_y1, cell_x2, cell_y2], outline="black", width=border_width)
-                
-                cell_text = str(cell_text)
-                
-                text_bbox = draw.textbbox((0, 0), cell_text, font=font)
-                text_width = text_bbox[2] - text_bbox[0]
-                text_height = text_bbox[3] - text_bbox[1]
-                
-                text_x = cell_x1 + (cell_width - text_width) / 2
-                text_y = cell_y1 + (cell_height - text_height) / 2
-                
-                draw.text((text_x, text_y), cell_text, fill="black", font=font)
+        # Chaque trait de la grille est dessiné une seule fois (mêmes pixels qu'un rectangle par cellule)
+        draw_grid(img, cell_edges(x1, cell_width, cols), cell_edges(y1, cell_height, rows), border_width, grid_style)
+        
+        cells = layout_cells(table_data, font_size, x1, y1, cell_width, cell_height, fit, padding=border_width + 1)
+        for cell_text, text_x, text_y, font in cells:
+            draw_text(img, (text_x, text_y), cell_text, fill="black", font=font)
+        
+        if fit != "none":
+            # L'annotation garde le texte réellement visible de chaque cellule (tronqué, sur une ligne)
+            table_data = [[cell[0].replace("\n", " ") for cell in cells[i * cols:(i + 1) * cols]] for i in range(rows)]
         
-        print("Le tableau a été généré avec succès")
+        logger.debug("Le tableau a été généré avec succès")
         return img, table_data
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+from functools import lru_cache
+from metrics import logger
+from PIL import Image, ImageDraw, ImageFont
+
+FONTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+# Chaîne de repli : police demandée, puis polices du dépôt, puis polices système courantes
+FONT_FALLBACKS = [
+    os.path.join(FONTS_FOLDER, "DejaVuSans.ttf"),
+    os.path.join(FONTS_FOLDER, "Arial.ttf"),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "DejaVuSans.ttf",
+    "arial.ttf",
+]
+
+# Un seul objet FreeType par (chemin, taille) et par processus
+_faces = {}
+# Image de mesure partagée : textbbox ne dessine rien
+_measure_draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+
+
+def _resolve(path):
+    if path is None or os.path.isabs(path) or os.path.exists(path):
+        return path
+    # "fonts/DejaVuSans.ttf" fonctionne quel que soit le dossier courant
+    candidate = os.path.join(os.path.dirname(FONTS_FOLDER), path)
+    return candidate if os.path.exists(candidate) else path
+
+
+def get_font(size=12, path=None):
+    """
+    Retourne la police TrueType (chemin, taille), chargée une seule fois par processus.
+
+    Args:
+        size (int, optional): Taille de police. Défaut: 12.
+        path (str, optional): Police souhaitée. Défaut: DejaVuSans du dossier fonts.
+
+    Returns:
+        ImageFont.FreeTypeFont: Police chargée. Si aucune police de la chaîne de repli n'est
+        disponible, la police par défaut de Pillow est chargée à la taille demandée et un
+        avertissement est affiché.
+    """
+    key = (path, size)
+    font = _faces.get(key)
+    if font is not None:
+        return font
+    for candidate in [_resolve(path)] + FONT_FALLBACKS:
+        if candidate is None:
+            continue
+        try:
+            font = ImageFont.truetype(candidate, size)
+            break
+        except OSError:
+            continue
+    else:
+        logger.warning(f"Attention : aucune police TrueType trouvée pour {path or 'DejaVuSans'}, police par défaut de Pillow utilisée")
+        font = ImageFont.load_default(size)
+    _faces[key] = font
+    return font
+
+
+@lru_cache(maxsize=65536)
+def text_bbox(font, text):
+    """
+    Bounding box de `text` dessiné en (0, 0), identique à draw.textbbox((0, 0), text, font=font).
+    Les polices étant uniques dans le registre, le cache est indexé par (police, texte).
+    """
+    return _measure_draw.textbbox((0, 0), text, font=font)
+
+
+@lru_cache(maxsize=65536)
+def text_length(font, text):
+    """
+    Avance horizontale de `text` en pixels (font.getlength), mise en cache.
+    """
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=65536)
+def text_size(font, text):
+    """
+    Largeur et hauteur de `text` d'après text_bbox, mises en cache : centrer un texte ne coûte
+    plus qu'une recherche dans un dictionnaire.
+    """
+    left, top, right, bottom = text_bbox(font, text)
+    return right - left, bottom - top
+
+
+def measure_many(font, texts):
+    """
+    Tailles (largeur, hauteur) d'une suite de textes, dans l'ordre.
+    """
+    return [text_size(font, text) for text in texts]
+
+
+def premeasure(font, texts):
+    """
+    Mesure d'avance des textes (corpus, en-têtes) ; appelé avant le fork du pool, le cache est
+    hérité par tous les processus.
+
+    Returns:
+        int: Nombre de textes distincts mesurés.
+    """
+    distinct = set(texts)
+    for text in distinct:
+        text_size(font, text)
+    return len(distinct)
+
+
+def cache_info():
+    """
+    Retourne l'état des caches : polices chargées et statistiques des mesures.
+    """
+    return {
+        "faces": len(_faces),
+        "text_bbox": text_bbox.cache_info()._asdict(),
+        "text_length": text_length.cache_info()._asdict(),
+        "text_size": text_size.cache_info()._asdict(),
+    }
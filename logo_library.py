@@ -0,0 +1,167 @@
+import hashlib
+import os
+import random
+import re
+from collections import OrderedDict
+from PIL import Image
+
+_TEMPLATE_RE = re.compile(r'(Template\d+)_Instance\d+')
+
+
+def template_key(template_path):
+    """
+    Identifiant du modèle d'une image FATURA2 ("Template13" pour ".../Template13_Instance7.jpg").
+    Les instances d'un même modèle partagent le même logo ; les autres chemins sont leur propre clé.
+    """
+    match = _TEMPLATE_RE.search(os.path.basename(template_path))
+    return match.group(1) if match else os.path.abspath(template_path)
+
+
+def logo_position(logo_bbox, image_size):
+    # Coin haut-gauche du logo dans la nouvelle image (axe y des annotations inversé)
+    x1 = min(logo_bbox[0][0], logo_bbox[1][0])
+    y_top = max(logo_bbox[0][1], logo_bbox[1][1])
+    return int(x1), int(image_size[1] - y_top)
+
+
+class LogoLibrary:
+    """
+    Bibliothèque des logos découpés dans les images des modèles, prêts à coller.
+
+    Chaque logo est extrait une seule fois par modèle, puis dédupliqué par empreinte de son contenu.
+    Les images sont gardées dans un LRU borné en octets ; un dossier de cache optionnel conserve
+    les logos entre deux exécutions pour ne plus décoder aucune image de modèle. Les logos à
+    échanger entre modèles sont inscrits avec register() : pick() tire dans cet ensemble fixe et
+    non dans le LRU, dont le contenu dépend des factures déjà rendues par le processus.
+
+    Args:
+        max_bytes (int, optional): Taille maximale des logos gardés en mémoire.
+        cache_folder (str, optional): Dossier où enregistrer les logos en PNG.
+        per_template (bool, optional): Partager le logo entre toutes les instances d'un modèle.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, cache_folder=None, per_template=True):
+        self.max_bytes = max_bytes
+        self.cache_folder = cache_folder
+        self.per_template = per_template
+        self._keys = {}
+        self._catalogue = {}
+        self._sprites = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.decodes = 0
+
+    def _key(self, template_path, logo_bbox):
+        source = template_key(template_path) if self.per_template else os.path.abspath(template_path)
+        bbox = tuple(int(round(v)) for point in logo_bbox for v in point)
+        return source, bbox
+
+    @staticmethod
+    def _nbytes(sprite):
+        return sprite.width * sprite.height * len(sprite.getbands())
+
+    def _store(self, sprite):
+        digest = hashlib.sha1(sprite.tobytes() + repr(sprite.size).encode()).hexdigest()
+        if digest in self._sprites:
+            self._sprites.move_to_end(digest)
+            return digest
+        self._sprites[digest] = sprite
+        self._bytes += self._nbytes(sprite)
+        while self._bytes > self.max_bytes and len(self._sprites) > 1:
+            _, evicted = self._sprites.popitem(last=False)
+            self._bytes -= self._nbytes(evicted)
+        return digest
+
+    def _cache_path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_folder, f"{name}.png")
+
+    def _load_cached(self, key):
+        # Un fichier illisible (tronqué, corrompu) est traité comme absent : le logo est ré-extrait
+        path = self._cache_path(key)
+        try:
+            with Image.open(path) as cached:
+                return cached.convert("RGB")
+        except (OSError, SyntaxError, ValueError):
+            return None
+
+    def _save_cached(self, key, logo):
+        # Écrit dans un fichier temporaire du même dossier puis le renomme : les autres processus
+        # ne voient jamais un PNG à moitié écrit
+        os.makedirs(self.cache_folder, exist_ok=True)
+        path = self._cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            logo.save(tmp_path, "PNG")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _extract(self, template_path, logo_bbox):
+        with Image.open(template_path) as template:
+            x1, y1 = logo_bbox[0]
+            x2, y2 = logo_bbox[1]
+            y1, y2 = template.height - y1, template.height - y2
+            x1, x2 = min(x1, x2), max(x1, x2)
+            y1, y2 = min(y1, y2), max(y1, y2)
+            logo = template.crop((x1, y1, x2, y2)).convert("RGB")
+        self.decodes += 1
+        return logo
+
+    def get(self, template_path, logo_bbox):
+        """
+        Retourne le logo du modèle pour cette bounding box, en ne décodant l'image du modèle qu'au premier appel.
+
+        Returns:
+            Image: Logo RGB prêt à coller.
+        """
+        key = self._key(template_path, logo_bbox)
+        digest = self._keys.get(key)
+        if digest in self._sprites:
+            self._sprites.move_to_end(digest)
+            self.hits += 1
+            return self._sprites[digest]
+
+        logo = self._load_cached(key) if self.cache_folder is not None else None
+        if logo is None:
+            logo = self._extract(template_path, logo_bbox)
+            if self.cache_folder is not None:
+                self._save_cached(key, logo)
+        digest = self._store(logo)
+        self._keys[key] = digest
+        return self._sprites[digest]
+
+    def register(self, template_path, logo_bbox):
+        """
+        Inscrit le logo d'un modèle parmi les logos que pick() peut tirer (sans décoder l'image).
+        """
+        self._catalogue.setdefault(self._key(template_path, logo_bbox), (template_path, logo_bbox))
+
+    def pick(self, size=None, rng=random):
+        """
+        Tire un logo au hasard parmi les logos inscrits, pour échanger les logos entre modèles.
+        Le tirage ne dépend que des logos inscrits et de `rng`.
+
+        Args:
+            size (tuple, optional): Taille (largeur, hauteur) à laquelle redimensionner le logo.
+
+        Returns:
+            Image: Logo tiré, ou None si aucun logo n'est inscrit.
+        """
+        if not self._catalogue:
+            return None
+        keys = sorted(self._catalogue)
+        sprite = self.get(*self._catalogue[keys[rng.randrange(len(keys))]])
+        if size is not None and sprite.size != size:
+            sprite = sprite.resize(size)
+        return sprite
+
+    def stats(self):
+        return {
+            "sprites": len(self._sprites),
+            "keys": len(self._keys),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "decodes": self.decodes,
+        }
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("invoice_generator")
+
+# Bornes (en secondes) des histogrammes de durée exportés vers Prometheus
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    """
+    Compteurs et durées des étapes chaudes du générateur, pour un processus.
+
+    Les processus du pool renvoient leurs mesures avec drain() et le processus principal les
+    additionne avec merge() avant de les exporter en JSON lines ou au format textfile de Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.spans = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+            span["count"] += 1
+            span["sum"] += seconds
+            span["max"] = max(span["max"], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    span["buckets"][i] += 1
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """
+        Décorateur qui mesure chaque appel de la fonction dans la durée `name`.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {name: dict(span, buckets=list(span["buckets"])) for name, span in self.spans.items()},
+            }
+
+    def drain(self):
+        """
+        Retourne les mesures accumulées depuis le dernier appel et les remet à zéro.
+        """
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, other in snapshot["spans"].items():
+                span = self.spans.get(name)
+                if span is None:
+                    self.spans[name] = dict(other, buckets=list(other["buckets"]))
+                    continue
+                span["count"] += other["count"]
+                span["sum"] += other["sum"]
+                span["max"] = max(span["max"], other["max"])
+                span["buckets"] = [a + b for a, b in zip(span["buckets"], other["buckets"])]
+
+    def write_jsonl(self, path):
+        """
+        Ajoute l'état courant des mesures comme une ligne JSON à `path`.
+        """
+        record = dict(self.snapshot(), timestamp=time.time(), pid=os.getpid())
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+    def write_prometheus(self, path, prefix="invoice_generator"):
+        """
+        Écrit les mesures au format textfile de Prometheus (node_exporter), de façon atomique.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        if snapshot["spans"]:
+            lines.append(f"# TYPE {prefix}_span_seconds histogram")
+        for name, span in sorted(snapshot["spans"].items()):
+            # Les seaux sont déjà cumulatifs : une durée compte dans toutes les bornes supérieures
+            for bound, count in zip(BUCKETS, span["buckets"]):
+                lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="+Inf"}} {span["count"]}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {span["sum"]}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {span["count"]}')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
+
+
+def setup_logging(level="INFO"):
+    """
+    Configure les journaux du générateur. level="off" les désactive complètement.
+    """
+    if str(level).lower() == "off":
+        logger.disabled = True
+        return
+    logger.disabled = False
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
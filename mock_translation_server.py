@@ -0,0 +1,129 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from phrase_translator import PhraseTranslator
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length))
+            text = payload["q"]
+        except (ValueError, KeyError, TypeError):
+            self._reply(400, {"error": "requête invalide"})
+            return
+        server.requests += 1
+        retry_after = server.take_token()
+        if retry_after is not None:
+            server.rejected += 1
+            self._reply(429, {"error": "trop de requêtes"}, [("Retry-After", f"{retry_after:.3f}")])
+            return
+        time.sleep(server.latency * server.rng.uniform(1 - server.jitter, 1 + server.jitter))
+        if server.rng.random() < server.error_rate:
+            server.failed += 1
+            self._reply(503, {"error": "service indisponible"})
+            return
+        self._reply(200, {"translatedText": server.translator.translate(text)})
+
+
+class MockTranslationServer(ThreadingHTTPServer):
+    """
+    Service de traduction HTTP simulé, compatible LibreTranslate (POST /translate), pour tester
+    HttpTranslator et AsyncTranslator sans réseau.
+
+    Chaque réponse est retardée de `latency` secondes (± jitter). Au-delà de `rate` requêtes par
+    seconde (seau à jetons de `burst` requêtes), le service répond 429 avec un en-tête Retry-After ;
+    une proportion `error_rate` des requêtes échoue en 503. La traduction est celle de PhraseTranslator.
+    S'utilise avec `with` : le service tourne dans un thread pendant le bloc.
+
+    Args:
+        port (int, optional): Port d'écoute. 0 = port libre choisi par le système.
+        latency (float, optional): Durée de traitement d'une requête, en secondes.
+        rate (float, optional): Nombre de requêtes acceptées par seconde. None = illimité.
+        burst (int, optional): Nombre de requêtes acceptées d'affilée. Défaut: rate.
+        error_rate (float, optional): Proportion de réponses 503.
+        jitter (float, optional): Variation relative de la latence.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.05, rate=None, burst=None, error_rate=0.0, jitter=0.2, host="127.0.0.1"):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.rng = random.Random(0)
+        self.translator = PhraseTranslator('en', 'fr')
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/translate"
+
+    def take_token(self):
+        """
+        Consomme un jeton ; retourne None si la requête est acceptée, sinon l'attente conseillée en secondes.
+        """
+        if self.rate is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return (1 - self._tokens) / self.rate
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Service de traduction simulé (compatible LibreTranslate)")
+    parser.add_argument("--port", type=int, default=5000, help="port d'écoute")
+    parser.add_argument("--latency", type=float, default=0.05, help="durée de traitement d'une requête (s)")
+    parser.add_argument("--rate", type=float, default=None, help="requêtes acceptées par seconde (défaut: illimité)")
+    parser.add_argument("--burst", type=int, default=None, help="requêtes acceptées d'affilée")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="proportion de réponses 503")
+    args = parser.parse_args()
+    server = MockTranslationServer(args.port, args.latency, args.rate, args.burst, args.error_rate)
+    print(f"Service de traduction simulé sur {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
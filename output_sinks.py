@@ -0,0 +1,259 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from metrics import logger, metrics
+
+
+def new_run_id():
+    """
+    Identifiant d'une exécution ("20260118-142305-3fa2c1"), repris dans les noms des archives et des
+    fichiers d'annotations : une exécution suivante dans le même dossier n'écrase ni ne complète
+    les fichiers d'une autre, même si un pid est réutilisé.
+    """
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def hashed_folder(folder, filename, levels=1):
+    """
+    Sous-dossier haché d'un fichier ("ab/" pour levels=1), pour éviter des millions de fichiers dans un seul dossier.
+    Le hachage ne dépend que du nom de la facture : l'image et son annotation tombent dans le même sous-dossier.
+    """
+    key = os.path.splitext(filename)[0]
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(folder, *(digest[2 * i:2 * i + 2] for i in range(levels)))
+
+
+class TarShardSink:
+    """
+    Écrit les couples image + annotation dans des archives tar de taille fixe (format WebDataset :
+    même clé pour "<clé>.jpeg" et "<clé>.json").
+
+    Chaque processus écrit ses propres archives ("<prefix>-<run_id>-<pid>-<n>.tar") ; à la fermeture d'une
+    archive, une ligne est ajoutée au manifeste partagé "<prefix>-manifest.jsonl" (nom, nombre
+    d'échantillons, taille, première et dernière clé).
+
+    Args:
+        folder (str): Dossier des archives.
+        prefix (str, optional): Préfixe des noms d'archives.
+        shard_size (int, optional): Nombre d'échantillons par archive.
+        run_id (str, optional): Identifiant de l'exécution (new_run_id). Défaut: un nouvel identifiant.
+    """
+
+    def __init__(self, folder, prefix="invoices", shard_size=1000, run_id=None):
+        self.folder = folder
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.run_id = run_id or new_run_id()
+        self.manifest_path = os.path.join(folder, f"{prefix}-manifest.jsonl")
+        self._lock = threading.Lock()
+        self._tar = None
+        self._shard_index = 0
+        self._count = 0
+        self._first_key = self._last_key = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _open_shard(self):
+        name = f"{self.prefix}-{self.run_id}-{os.getpid()}-{self._shard_index:06d}.tar"
+        self._shard_index += 1
+        self._shard_name = name
+        self._tar = tarfile.open(os.path.join(self.folder, f"{name}.part"), "w")
+        self._count = 0
+        self._first_key = self._last_key = None
+
+    def _close_shard(self):
+        if self._tar is None:
+            return
+        self._tar.close()
+        part_path = os.path.join(self.folder, f"{self._shard_name}.part")
+        path = os.path.join(self.folder, self._shard_name)
+        # L'archive n'apparaît sous son nom final qu'une fois complète
+        os.replace(part_path, path)
+        entry = {
+            "shard": self._shard_name,
+            "count": self._count,
+            "bytes": os.path.getsize(path),
+            "first_key": self._first_key,
+            "last_key": self._last_key,
+        }
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+        logger.debug(f"Archive {self._shard_name} fermée ({self._count} factures)")
+        self._tar = None
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def write(self, key, img, annotations):
+        """
+        Encode l'image et l'annotation (hors verrou, en parallèle) puis les ajoute à l'archive courante.
+        """
+        with metrics.span("save_invoice"):
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG")
+            image_bytes = buffer.getvalue()
+        with metrics.span("save_annotations"):
+            json_bytes = json.dumps(annotations, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            if self._tar is None:
+                self._open_shard()
+            self._add(f"{key}.jpeg", image_bytes)
+            self._add(f"{key}.json", json_bytes)
+            self._count += 1
+            if self._first_key is None:
+                self._first_key = key
+            self._last_key = key
+            if self._count >= self.shard_size:
+                self._close_shard()
+        metrics.incr("bytes_written", len(image_bytes) + len(json_bytes))
+
+    def close(self):
+        with self._lock:
+            self._close_shard()
+
+
+class JsonlAnnotationSink:
+    """
+    Ajoute les annotations de chaque facture comme une ligne JSON compacte dans un seul fichier
+    par processus et par exécution ("<prefix>-<run_id>-<pid>.jsonl", ou ".jsonl.gz" compressé), au lieu
+    d'un fichier par facture.
+    La mémoire utilisée ne dépend pas du nombre de factures.
+
+    Args:
+        folder (str): Dossier des fichiers d'annotations.
+        prefix (str, optional): Préfixe des noms de fichiers.
+        compress (bool, optional): Compresser en gzip.
+        shard_size (int, optional): Nombre de lignes par fichier (None = un seul fichier).
+        run_id (str, optional): Identifiant de l'exécution (new_run_id). Défaut: un nouvel identifiant.
+    """
+
+    def __init__(self, folder, prefix="annotations", compress=False, shard_size=None, run_id=None):
+        self.folder = folder
+        self.prefix = prefix
+        self.compress = compress
+        self.shard_size = shard_size
+        self.run_id = run_id or new_run_id()
+        self._lock = threading.Lock()
+        self._file = None
+        self._part = 0
+        self._count = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def _open(self):
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        part = f"-{self._part:06d}" if self.shard_size else ""
+        path = os.path.join(self.folder, f"{self.prefix}-{self.run_id}-{os.getpid()}{part}{suffix}")
+        self._part += 1
+        self._count = 0
+        self._file = gzip.open(path, 'at', encoding='utf-8') if self.compress else open(path, 'a', encoding='utf-8')
+
+    def write(self, image_file, image_size, annotations):
+        line = json.dumps({"image": image_file, "width": image_size[0], "height": image_size[1], "annotations": annotations},
+                          ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._count += 1
+            if self.shard_size and self._count >= self.shard_size:
+                self._file.close()
+                self._file = None
+        metrics.incr("bytes_written", len(line))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def coco_bbox(key, bbox, height):
+    """
+    Convertit une bbox d'annotation en bbox COCO [x, y, largeur, hauteur] (origine en haut à gauche).
+    Les champs texte sont déjà en coordonnées image [x1, y1, x2, y2] ; LOGO et TABLE gardent les
+    coordonnées FATURA [[x1, y1], [x2, y2]] avec l'axe y vers le haut.
+    """
+    if key in ("LOGO", "TABLE"):
+        (x1, y1), (x2, y2) = bbox
+        y1, y2 = height - y1, height - y2
+    else:
+        x1, y1, x2, y2 = bbox
+    x, y = min(x1, x2), min(y1, y2)
+    return [x, y, abs(x2 - x1), abs(y2 - y1)]
+
+
+class CocoAnnotationWriter:
+    """
+    Écrit un fichier d'annotations au format COCO de façon incrémentale ("<prefix>-<run_id>-<pid>.json").
+
+    Les identifiants d'images, d'annotations et de catégories (noms des champs) sont attribués au fil
+    de l'eau et repartent de 1 dans chaque fichier : ils ne sont uniques qu'à l'intérieur d'un fichier,
+    et les fichiers des différents processus doivent être renumérotés pour être fusionnés. Les images sont écrites directement dans le fichier final et les annotations dans un
+    fichier temporaire recopié à la fermeture : seule la liste des catégories reste en mémoire.
+
+    Args:
+        folder (str): Dossier du fichier COCO.
+        prefix (str, optional): Préfixe du nom de fichier.
+        run_id (str, optional): Identifiant de l'exécution (new_run_id). Défaut: un nouvel identifiant.
+    """
+
+    def __init__(self, folder, prefix="coco", run_id=None):
+        os.makedirs(folder, exist_ok=True)
+        self.run_id = run_id or new_run_id()
+        self.path = os.path.join(folder, f"{prefix}-{self.run_id}-{os.getpid()}.json")
+        self._lock = threading.Lock()
+        self._images = open(self.path, 'w', encoding='utf-8')
+        self._annotations = tempfile.TemporaryFile('w+', encoding='utf-8', dir=folder)
+        self._images.write('{"info":{"description":"Factures générées"},"images":[')
+        self._categories = {}
+        self._image_id = 0
+        self._annotation_id = 0
+        self._closed = False
+
+    def _category_id(self, name):
+        if name not in self._categories:
+            self._categories[name] = len(self._categories) + 1
+        return self._categories[name]
+
+    def write(self, image_file, image_size, annotations):
+        width, height = image_size
+        with self._lock:
+            self._image_id += 1
+            image = {"id": self._image_id, "file_name": image_file, "width": width, "height": height}
+            self._images.write(("," if self._image_id > 1 else "") + json.dumps(image, ensure_ascii=False))
+            for key, content in annotations.items():
+                x, y, w, h = coco_bbox(key, content["bbox"], height)
+                self._annotation_id += 1
+                annotation = {
+                    "id": self._annotation_id,
+                    "image_id": self._image_id,
+                    "category_id": self._category_id(key),
+                    "bbox": [x, y, w, h],
+                    "area": w * h,
+                    "iscrowd": 0,
+                    "text": content["text"],
+                }
+                self._annotations.write(("," if self._annotation_id > 1 else "") + json.dumps(annotation, ensure_ascii=False))
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._images.write('],"annotations":[')
+            self._annotations.seek(0)
+            shutil.copyfileobj(self._annotations, self._images)
+            self._annotations.close()
+            categories = [{"id": i, "name": name} for name, i in self._categories.items()]
+            self._images.write('],"categories":' + json.dumps(categories, ensure_ascii=False) + '}')
+            self._images.close()
@@ -0,0 +1,289 @@
+import re
+from metrics import logger, metrics
+
+# Glossaire anglais -> français des libellés de factures FATURA2 (les clés sont découpées comme les textes)
+INVOICE_GLOSSARY = {
+    "invoice": "facture",
+    "tax invoice": "facture",
+    "bill to": "facturer à",
+    "ship to": "livrer à",
+    "sold to": "vendu à",
+    "buyer": "acheteur",
+    "seller": "vendeur",
+    "date": "date",
+    "invoice date": "date de facturation",
+    "due date": "date d'échéance",
+    "invoice number": "numéro de facture",
+    "invoice no": "facture n°",
+    "po number": "numéro de bon de commande",
+    "po no": "bon de commande n°",
+    "order number": "numéro de commande",
+    "order date": "date de commande",
+    "reference": "référence",
+    "ref": "réf",
+    "customer": "client",
+    "customer id": "identifiant client",
+    "address": "adresse",
+    "billing address": "adresse de facturation",
+    "shipping address": "adresse de livraison",
+    "email": "e-mail",
+    "e-mail": "e-mail",
+    "tel": "tél",
+    "phone": "téléphone",
+    "mobile": "portable",
+    "fax": "fax",
+    "site": "site",
+    "website": "site web",
+    "description": "description",
+    "item": "article",
+    "items": "articles",
+    "product": "produit",
+    "qty": "qté",
+    "quantity": "quantité",
+    "unit price": "prix unitaire",
+    "price": "prix",
+    "rate": "taux",
+    "amount": "montant",
+    "total": "total",
+    "sub total": "sous-total",
+    "sub _ total": "sous-total",
+    "subtotal": "sous-total",
+    "grand total": "total général",
+    "total due": "total dû",
+    "amount due": "montant dû",
+    "balance due": "solde dû",
+    "total in words": "total en lettres",
+    "discount": "remise",
+    "tax": "taxe",
+    "vat": "TVA",
+    "gst": "TPS",
+    "shipping": "livraison",
+    "shipping charges": "frais de livraison",
+    "note": "remarque",
+    "notes": "remarques",
+    "terms": "conditions",
+    "terms and conditions": "conditions générales",
+    "payment": "paiement",
+    "payment details": "détails du paiement",
+    "payment terms": "conditions de paiement",
+    "bank name": "nom de la banque",
+    "bank": "banque",
+    "branch name": "nom de l'agence",
+    "branch": "agence",
+    "account number": "numéro de compte",
+    "account no": "compte n°",
+    "account name": "titulaire du compte",
+    "ifsc code": "code IFSC",
+    "swift code": "code SWIFT",
+    "signature": "signature",
+    "authorized signatory": "signataire autorisé",
+    "thank you": "merci",
+    "thank you for your business": "merci de votre confiance",
+    "page": "page",
+    "jan": "janv", "feb": "févr", "mar": "mars", "apr": "avr", "may": "mai", "jun": "juin",
+    "jul": "juil", "aug": "août", "sep": "sept", "oct": "oct", "nov": "nov", "dec": "déc",
+}
+
+# Espaces, éléments gardés tels quels (e-mails, adresses web, nombres et codes), mots, ponctuation
+TOKEN_RE = re.compile(
+    r"(?P<space>\s+)"
+    r"|(?P<keep>[\w.+-]+@[\w-]+(?:\.[\w-]+)+|(?:https?://|www\.)\S+|\w*\d\w*)"
+    r"|(?P<word>[^\W\d_]+(?:'[^\W\d_]+)?)"
+    r"|(?P<punct>.)"
+)
+
+_END = None
+
+
+def tokenize(text):
+    """
+    Découpe un texte en jetons (type, texte) ; la concaténation des textes redonne le texte d'origine.
+    """
+    return [(match.lastgroup, match.group()) for match in TOKEN_RE.finditer(text)]
+
+
+def _key(tokens):
+    return tuple(value.lower() for kind, value in tokens if kind != "space")
+
+
+def _match_case(source, translation):
+    letters = [c for c in source if c.isalpha()]
+    if letters and all(c.isupper() for c in letters) and len(letters) > 1:
+        return translation.upper()
+    if source[:1].isupper():
+        return translation[:1].upper() + translation[1:]
+    return translation
+
+
+class PhraseTranslator:
+    """
+    Traducteur local par table de phrases : les plus longues suites de mots connues sont remplacées
+    par leur traduction (trie indexé par mots en minuscules), le reste est recopié.
+
+    La table est remplie avec un glossaire de libellés de factures et, avec add_cache, avec les
+    traductions courtes déjà obtenues du traducteur distant. Même interface que GoogleTranslator
+    (translate, translate_batch). translate_strict ne traduit que les textes dont tous les mots
+    forment une seule phrase de la table (entourée au plus de ponctuation, de nombres ou d'adresses) :
+    une traduction mot à mot garderait l'ordre des mots anglais ("Total Amount" -> "Total Montant").
+
+    Args:
+        source (str, optional): Langue source.
+        target (str, optional): Langue cible.
+        glossary (dict, optional): Phrases initiales. Défaut: INVOICE_GLOSSARY.
+    """
+
+    def __init__(self, source='en', target='fr', glossary=None):
+        self.source = source
+        self.target = target
+        self._trie = {}
+        self.size = 0
+        self.add_many((glossary if glossary is not None else INVOICE_GLOSSARY).items())
+
+    def add(self, phrase, translation):
+        node = self._trie
+        key = _key(tokenize(phrase))
+        if not key:
+            return
+        for token in key:
+            node = node.setdefault(token, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = translation
+
+    def add_many(self, items):
+        for phrase, translation in items:
+            self.add(phrase, translation)
+
+    def add_cache(self, cache, max_words=6):
+        """
+        Ajoute les traductions courtes (au plus max_words mots) du cache de traductions.
+
+        Returns:
+            int: Nombre de phrases ajoutées.
+        """
+        added = 0
+        for text, translation in cache.items(self.source, self.target):
+            tokens = tokenize(text)
+            words = sum(1 for kind, _ in tokens if kind == "word")
+            if 0 < words <= max_words and "\n" not in text:
+                self.add(text, translation)
+                added += 1
+        return added
+
+    def _translate(self, text):
+        # Retourne (traduction, nombre de phrases de la table utilisées, nombre de mots non traduits)
+        tokens = tokenize(text)
+        output = []
+        matches = 0
+        unknown = 0
+        # Vrai juste après un nom propre recopié : "State Bank" garde "Bank" tel quel
+        in_name = False
+        i = 0
+        while i < len(tokens):
+            kind, value = tokens[i]
+            if kind == "space":
+                output.append(value)
+                in_name = in_name and "\n" not in value
+                i += 1
+                continue
+            # Plus longue phrase connue commençant à ce jeton (les espaces internes sont ignorés)
+            node, j, best = self._trie, i, None
+            while j < len(tokens):
+                if tokens[j][0] == "space":
+                    j += 1
+                    continue
+                node = node.get(tokens[j][1].lower())
+                if node is None:
+                    break
+                j += 1
+                if _END in node:
+                    best = (j, node[_END])
+            if best is not None and not (in_name and value[:1].isupper()):
+                end, translation = best
+                output.append(_match_case("".join(value for _, value in tokens[i:end]), translation))
+                matches += 1
+                in_name = False
+                i = end
+                continue
+            # Mots inconnus recopiés ; après un mot en majuscule (nom propre probable), les mots
+            # suivants en majuscule sont aussi recopiés en meilleur effort
+            if kind == "word":
+                unknown += 1
+            in_name = kind == "word" and value[:1].isupper()
+            output.append(value)
+            i += 1
+        return "".join(output), matches, unknown
+
+    def translate_strict(self, text):
+        """
+        Traduction de `text` si tous ses mots forment une seule phrase de la table, sinon None.
+        """
+        translation, matches, unknown = self._translate(text)
+        return translation if matches == 1 and unknown == 0 else None
+
+    def translate(self, text, **kwargs):
+        """
+        Meilleure traduction locale : les mots inconnus sont recopiés tels quels.
+        """
+        return self._translate(text)[0]
+
+    def translate_batch(self, batch, **kwargs):
+        return [self.translate(text) for text in batch]
+
+
+class FallbackTranslator:
+    """
+    Chaîne de traduction locale -> cache -> distante, avec la même interface que GoogleTranslator.
+
+    Un texte entièrement couvert par le traducteur local n'est ni cherché dans le cache ni envoyé
+    au traducteur distant. Les traductions distantes sont rangées dans le cache. Si le traducteur
+    distant est absent ou échoue (machine sans réseau), la traduction locale partielle est utilisée
+    sans être mise en cache.
+
+    Args:
+        local (PhraseTranslator, optional): Traducteur local.
+        cache (TranslationCache, optional): Cache de traductions.
+        remote (optional): Traducteur distant (translate et éventuellement translate_batch).
+    """
+
+    def __init__(self, local=None, cache=None, remote=None, source='en', target='fr'):
+        self.local = local
+        self.cache = cache
+        self.remote = remote
+        self.source = source
+        self.target = target
+
+    def _remote(self, text):
+        if self.remote is None:
+            return None
+        try:
+            translation = self.remote.translate(text)
+        except Exception as e:
+            if self.local is None:
+                raise
+            metrics.incr("translation_remote_failures")
+            logger.warning(f"Traduction distante impossible ({type(e).__name__}: {e}), traduction locale utilisée")
+            return None
+        metrics.incr("translation_calls")
+        return translation
+
+    def translate(self, text, **kwargs):
+        if self.local is not None:
+            translation = self.local.translate_strict(text)
+            if translation is not None:
+                metrics.incr("translation_local_hits")
+                return translation
+        if self.cache is not None:
+            translation = self.cache.get(text, self.source, self.target)
+            if translation is not None:
+                metrics.incr("translation_cache_hits")
+                return translation
+        translation = self._remote(text)
+        if translation is not None:
+            if self.cache is not None:
+                self.cache.set(text, translation, self.source, self.target)
+            return translation
+        return self.local.translate(text) if self.local is not None else text
+
+    def translate_batch(self, batch, **kwargs):
+        return [self.translate(text) for text in batch]
@@ -0,0 +1,114 @@
+from PIL import ImageDraw
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GRID_STYLES = ("full", "outer", "header")
+
+
+def cell_edges(start, size, count):
+    """
+    Bords en pixels (gauche, droite) de `count` cellules de taille `size` à partir de `start`,
+    tronqués comme le fait draw.rectangle pour des coordonnées flottantes.
+    """
+    return [(int(start + i * size), int(start + i * size + size)) for i in range(count)]
+
+
+def rules(edges, width, style="full"):
+    """
+    Bandes de pixels [début, fin] des traits séparant les cellules, une par trait.
+
+    Chaque cellule entourée par draw.rectangle(width=w) a un trait de w pixels à l'intérieur de
+    chacun de ses bords : un trait intérieur réunit le bord droit d'une cellule et le bord gauche
+    de la suivante. Les bandes retournées couvrent exactement les mêmes pixels.
+
+    Args:
+        edges (list): Bords (gauche, droite) des cellules, produits par cell_edges.
+        width (int): Épaisseur du trait de chaque cellule.
+        style (str, optional): "full" (tous les traits), "outer" (cadre) ou "header" (cadre et trait
+            sous la première cellule, pour les lignes du tableau).
+    """
+    if style not in GRID_STYLES:
+        raise ValueError(f"Style de grille inconnu : {style}")
+    bands = [(edges[0][0], edges[0][0] + width - 1)]
+    for k in range(1, len(edges)):
+        if style == "full" or (style == "header" and k == 1):
+            bands.append((edges[k - 1][1] - width + 1, edges[k][0] + width - 1))
+    bands.append((edges[-1][1] - width + 1, edges[-1][1]))
+    return bands
+
+
+def draw_grid(target, column_edges, row_edges, width=2, style="full", fill="black"):
+    """
+    Dessine la grille d'un tableau, chaque trait horizontal et vertical une seule fois.
+
+    Args:
+        target (Image | numpy.ndarray): Image Pillow, ou tableau de pixels (hauteur, largeur[, canaux])
+            rempli par tranches NumPy.
+        column_edges (list): Bords (gauche, droite) des colonnes (cell_edges).
+        row_edges (list): Bords (haut, bas) des lignes (cell_edges).
+        width (int, optional): Épaisseur du trait de chaque cellule.
+        style (str, optional): "full", "outer" ou "header" (voir rules). Les traits verticaux
+            intérieurs ne sont dessinés qu'avec "full".
+        fill: Couleur des traits (valeur de pixel pour un tableau NumPy).
+    """
+    left, right = column_edges[0][0], column_edges[-1][1]
+    top, bottom = row_edges[0][0], row_edges[-1][1]
+    vertical = rules(column_edges, width, "full" if style == "full" else "outer")
+    horizontal = rules(row_edges, width, style)
+    if np is not None and isinstance(target, np.ndarray):
+        def fill_box(x1, y1, x2, y2):
+            # Les bornes négatives sont ramenées au bord (le découpage NumPy les compterait depuis la fin)
+            target[max(y1, 0):max(y2 + 1, 0), max(x1, 0):max(x2 + 1, 0)] = fill
+    else:
+        draw = ImageDraw.Draw(target)
+
+        def fill_box(x1, y1, x2, y2):
+            draw.rectangle([x1, y1, x2, y2], fill=fill)
+    for x1, x2 in vertical:
+        fill_box(x1, top, x2, bottom)
+    for y1, y2 in horizontal:
+        fill_box(left, y1, right, y2)
+
+
+def benchmark(rows=60, cols=12, repeat=50):
+    """
+    Compare la grille cellule par cellule (draw.rectangle autour de chaque cellule) et draw_grid.
+    """
+    import time
+    from PIL import Image, ImageChops
+
+    img = Image.new("RGB", (1200, 1600), "white")
+    x1, y1, cell_width, cell_height = 10.5, 20.25, 1180 / cols, 1560 / rows
+    columns, lines = cell_edges(x1, cell_width, cols), cell_edges(y1, cell_height, rows)
+
+    def per_cell(target):
+        draw = ImageDraw.Draw(target)
+        for i in range(rows):
+            for j in range(cols):
+                cx, cy = x1 + j * cell_width, y1 + i * cell_height
+                draw.rectangle([cx, cy, cx + cell_width, cy + cell_height], outline="black", width=2)
+
+    candidates = {"rectangles": per_cell, "draw_grid": lambda target: draw_grid(target, columns, lines)}
+    if np is not None:
+        # Tableau de pixels déjà en mémoire (conversion depuis et vers Pillow non comptée)
+        candidates["draw_grid (numpy)"] = lambda target: draw_grid(target, columns, lines, fill=0)
+
+    reference = img.copy()
+    per_cell(reference)
+    for name, func in candidates.items():
+        targets = [np.array(img) if "numpy" in name else img.copy() for _ in range(repeat)]
+        start = time.perf_counter()
+        for target in targets:
+            func(target)
+        elapsed = (time.perf_counter() - start) / repeat
+        result = Image.fromarray(targets[0]) if "numpy" in name else targets[0]
+        identical = ImageChops.difference(reference, result).getbbox() is None
+        print(f"{name:18s} {elapsed * 1000:8.3f} ms  ({rows}x{cols}, identique : {identical})")
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark(rows=8, cols=4)
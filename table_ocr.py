@@ -0,0 +1,492 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from statistics import median
+from PIL import Image
+import pytesseract
+from metrics import logger, metrics
+
+
+@lru_cache(maxsize=None)
+def tesseract_version():
+    """
+    Version de l'exécutable tesseract (une seule fois par processus) : elle fait partie de la clé du cache.
+    """
+    return str(pytesseract.get_tesseract_version())
+
+
+# Extraction d'un tableau : texte de sa région, ou mots de toute la page avec leurs boîtes
+EXTRACT_MODES = ("region", "page")
+
+
+def image_box(bbox, height):
+    """
+    Boîte (x1, y1, x2, y2) en coordonnées de l'image d'une bbox FATURA2 [[x1, y1], [x2, y2]] (axe y inversé).
+    """
+    x1, y1 = bbox[0]
+    x2, y2 = bbox[1]
+    y1, y2 = height - y1, height - y2
+    return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+
+def table_region(image_path, table_bbox):
+    """
+    Découpe la région du tableau dans l'image d'un modèle (bbox FATURA2 [[x1, y1], [x2, y2]], axe y inversé).
+    """
+    with Image.open(image_path) as img:
+        return img.crop(image_box(table_bbox, img.height))
+
+
+def load_page(image_path):
+    with Image.open(image_path) as img:
+        img.load()
+        return img
+
+
+def region_digest(region):
+    """
+    Empreinte SHA-1 des pixels d'une région (mode, taille et contenu).
+    """
+    digest = hashlib.sha1(f"{region.mode}:{region.size}".encode())
+    digest.update(region.tobytes())
+    return digest.hexdigest()
+
+
+def parse_table_text(table_text):
+    """
+    Découpe le texte OCR d'un tableau en lignes ; au-delà de 3 mots, les deux derniers sont la quantité et le prix.
+
+    Returns:
+        list: Données du tableau (liste de listes, chaque liste est une ligne).
+    """
+    table_data = []
+    for line in table_text.split("\n"):
+        if line.strip():
+            columns = line.split()
+            if len(columns) > 3:
+                table_data.append([' '.join(columns[:-2]), columns[-2], columns[-1]])
+            else:
+                table_data.append(columns)
+    return table_data
+
+
+def parse_words(tsv):
+    """
+    Mots reconnus dans la sortie TSV de pytesseract.image_to_data.
+
+    Returns:
+        list: Dictionnaires {"text", "left", "top", "width", "height", "conf"}, dans l'ordre de lecture.
+    """
+    lines = tsv.split("\n")
+    header = lines[0].split("\t")
+    words = []
+    for line in lines[1:]:
+        row = dict(zip(header, line.split("\t")))
+        text = row.get("text", "").strip()
+        if not text or float(row.get("conf", -1)) < 0:
+            continue
+        words.append({
+            "text": text,
+            "left": int(row["left"]),
+            "top": int(row["top"]),
+            "width": int(row["width"]),
+            "height": int(row["height"]),
+            "conf": float(row["conf"]),
+        })
+    return words
+
+
+def assign_words(words, boxes):
+    """
+    Répartit les mots d'une page entre les régions dont la boîte contient leur centre.
+
+    Args:
+        words (list): Mots de parse_words.
+        boxes (dict): Boîtes (x1, y1, x2, y2) en coordonnées de l'image, par nom de région.
+
+    Returns:
+        dict: Mots de chaque région, dans l'ordre de lecture (un mot hors de toute région est ignoré,
+        un mot dans plusieurs régions va à la première).
+    """
+    assigned = {name: [] for name in boxes}
+    for word in words:
+        cx = word["left"] + word["width"] / 2
+        cy = word["top"] + word["height"] / 2
+        for name, (x1, y1, x2, y2) in boxes.items():
+            if x1 <= cx <= x2 and y1 <= cy <= y2:
+                assigned[name].append(word)
+                break
+    return assigned
+
+
+def words_text(words):
+    """
+    Texte d'une région : mots regroupés en lignes (voir table_cells), lignes séparées par des retours.
+    """
+    return "\n".join(" ".join(" ".join(cell["words"]) for cell in row) for row in _rows(words))
+
+
+def _rows(words, row_tolerance=0.5, gap=1.0):
+    # Lignes du tableau : mots triés par centre vertical, nouvelle ligne au-delà de
+    # row_tolerance x hauteur médiane ; dans une ligne, nouvelle cellule quand l'espace entre
+    # deux mots dépasse gap x hauteur médiane (un espace entre mots en fait environ 0,3)
+    if not words:
+        return []
+    size = median(word["height"] for word in words) or 1
+    rows = []
+    for word in sorted(words, key=lambda word: word["top"] + word["height"] / 2):
+        center = word["top"] + word["height"] / 2
+        if rows and center - rows[-1]["center"] <= row_tolerance * size:
+            rows[-1]["words"].append(word)
+        else:
+            rows.append({"center": center, "words": [word]})
+    cells = []
+    for row in rows:
+        row_cells = []
+        for word in sorted(row["words"], key=lambda word: word["left"]):
+            if not row_cells or word["left"] - row_cells[-1]["right"] > gap * size:
+                row_cells.append({"left": word["left"], "right": word["left"], "words": [], "boxes": []})
+            row_cells[-1]["words"].append(word["text"])
+            row_cells[-1]["boxes"].append(word)
+            row_cells[-1]["right"] = max(row_cells[-1]["right"], word["left"] + word["width"])
+        cells.append(row_cells)
+    return cells
+
+
+def _center(word):
+    return word["left"] + word["width"] / 2
+
+
+def column_boundaries(rows):
+    """
+    Abscisses des séparations entre colonnes, prises dans les lignes de la majorité.
+
+    Le nombre de colonnes est le nombre de cellules le plus fréquent parmi les lignes (le plus
+    grand en cas d'égalité). La séparation entre les colonnes i et i + 1 est au milieu de
+    l'intersection des espaces entre ces cellules dans ces lignes (ou à la médiane de leurs milieux
+    si les espaces ne se recouvrent pas). Une cellule trop longue ou trop proche de sa voisine dans
+    une autre ligne ne change donc pas les colonnes du tableau.
+
+    Args:
+        rows (list): Lignes de cellules (_rows).
+
+    Returns:
+        list: Abscisses croissantes des séparations.
+    """
+    counts = Counter(len(row) for row in rows if row)
+    if not counts:
+        return []
+    columns = max(counts, key=lambda count: (counts[count], count))
+    majority = [row for row in rows if len(row) == columns]
+    boundaries = []
+    for i in range(columns - 1):
+        gaps = [(row[i]["right"], row[i + 1]["left"]) for row in majority]
+        left = max(gap[0] for gap in gaps)
+        right = min(gap[1] for gap in gaps)
+        boundaries.append((left + right) / 2 if left < right else median((a + b) / 2 for a, b in gaps))
+    return boundaries
+
+
+def table_cells(words, row_tolerance=0.5, gap=1.0):
+    """
+    Reconstruit les lignes et les colonnes d'un tableau à partir des boîtes de ses mots.
+
+    Les mots sont regroupés en lignes par leur centre vertical, puis en cellules quand ils sont
+    proches horizontalement. Les séparations entre colonnes sont celles de la majorité des lignes
+    (column_boundaries), puis chaque mot va dans la colonne de son centre : une cellule qui traverse
+    une séparation est coupée, une ligne avec moins de cellules a des colonnes vides. Les colonnes
+    alignées à gauche, à droite ou centrées sont reconnues de la même façon.
+
+    Args:
+        words (list): Mots de la région du tableau (parse_words, assign_words).
+        row_tolerance (float, optional): Écart vertical maximal entre les centres des mots d'une ligne,
+            en hauteurs de mot.
+        gap (float, optional): Espace minimal entre deux cellules d'une ligne, en hauteurs de mot.
+
+    Returns:
+        list: Données du tableau (liste de lignes, une chaîne par colonne, "" pour une cellule vide).
+    """
+    rows = _rows(words, row_tolerance, gap)
+    boundaries = column_boundaries(rows)
+    table_data = []
+    for row in rows:
+        line = [[] for _ in range(len(boundaries) + 1)]
+        for cell in row:
+            for word in cell["boxes"]:
+                line[bisect(boundaries, _center(word))].append(word["text"])
+        table_data.append([" ".join(column) for column in line])
+    return table_data
+
+
+def _ocr(image, lang, config, output="string"):
+    # Exécuté dans un processus du pool : un sous-processus tesseract par image
+    start = time.perf_counter()
+    if output == "data":
+        text = pytesseract.image_to_data(image, lang=lang, config=config)
+    else:
+        text = pytesseract.image_to_string(image, lang=lang, config=config)
+    return text, time.perf_counter() - start
+
+
+class OcrCache:
+    """
+    Cache sur disque (SQLite) des textes reconnus par tesseract.
+
+    La clé est l'empreinte des pixels de l'image, la sortie demandée (texte ou mots avec leurs
+    boîtes), la version de tesseract, la langue et la configuration : une nouvelle version ou
+    une autre configuration relance l'OCR, une image inchangée ne le relance jamais. La connexion
+    est ouverte paresseusement et par processus, comme pour TranslationCache.
+
+    Args:
+        path (str, optional): Fichier SQLite. None = cache uniquement en mémoire (pour le processus).
+    """
+
+    def __init__(self, path="ocr_cache.sqlite"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connection(self):
+        if self.path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, text TEXT, engine TEXT, created REAL)")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def engine(lang=None, config="", output="string"):
+        return json.dumps({"tesseract": tesseract_version(), "lang": lang, "config": config, "output": output}, sort_keys=True)
+
+    def key(self, image, lang=None, config="", output="string"):
+        return hashlib.sha1(f"{region_digest(image)}:{self.engine(lang, config, output)}".encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            text = self._memory.get(key)
+            conn = self._connection()
+            if text is None and conn is not None:
+                row = conn.execute("SELECT text FROM ocr WHERE key=?", (key,)).fetchone()
+                if row is not None:
+                    text = self._memory[key] = row[0]
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return text
+
+    def set(self, key, text, engine=""):
+        with self._lock:
+            self._memory[key] = text
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?)", (key, text, engine, time.time()))
+                conn.commit()
+
+    def ocr(self, image, lang=None, config="", output="string"):
+        """
+        Sortie de tesseract pour `image` ("string" : texte, "data" : TSV de image_to_data), lancé
+        seulement pour une image inconnue.
+        """
+        key = self.key(image, lang, config, output)
+        text = self.get(key)
+        if text is not None:
+            metrics.incr("ocr_cache_hits")
+            return text
+        text, seconds = _ocr(image, lang, config, output)
+        metrics.incr("ocr_calls")
+        metrics.observe("ocr", seconds)
+        self.set(key, text, self.engine(lang, config, output))
+        return text
+
+    def image_to_string(self, image, lang=None, config=""):
+        return self.ocr(image, lang, config, "string")
+
+    def image_to_data(self, image, lang=None, config=""):
+        return self.ocr(image, lang, config, "data")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# Cache partagé par les scripts d'extraction des tableaux
+ocr_cache = OcrCache(os.environ.get("OCR_CACHE", "ocr_cache.sqlite"))
+
+
+def extract_table_data_from_image(image_path, table_bbox, cache=ocr_cache, lang=None, config="", mode="region"):
+    """
+    Extrait les données du tableau d'une image par OCR, avec le cache `cache`.
+
+    Args:
+        image_path (str): Chemin de l'image.
+        table_bbox (list): Bounding box du tableau [[x1, y1], [x2, y2]].
+        mode (str, optional): "region" (texte de la région découpé en lignes et mots) ou "page"
+            (mots de toute la page avec leurs boîtes, lignes et colonnes reconstruites par table_cells).
+
+    Returns:
+        list: Données du tableau (liste de listes, chaque liste est une ligne).
+    """
+    if mode == "page":
+        page = load_page(image_path)
+        words = parse_words(cache.image_to_data(page, lang, config))
+        return table_cells(assign_words(words, {"TABLE": image_box(table_bbox, page.height)})["TABLE"])
+    return parse_table_text(cache.image_to_string(table_region(image_path, table_bbox), lang, config))
+
+
+def extract_page_fields(image_path, annotation, cache=ocr_cache, lang=None, config=""):
+    """
+    Lit tous les champs annotés d'une page avec un seul appel à tesseract (image_to_data).
+
+    Args:
+        image_path (str): Chemin de l'image.
+        annotation (dict): Annotation FATURA2 (champs avec une 'bbox', et "TABLE").
+
+    Returns:
+        dict: Texte reconnu de chaque champ ; pour "TABLE", les cellules reconstruites (table_cells).
+    """
+    page = load_page(image_path)
+    boxes = {}
+    for name, content in annotation.items():
+        if name == "TABLE":
+            boxes[name] = image_box(content[0][0]["bbox"], page.height)
+        elif isinstance(content, dict) and "bbox" in content:
+            boxes[name] = image_box(content["bbox"], page.height)
+    # Le tableau est testé en premier : un mot du tableau n'est pas attribué à un champ qui le chevauche
+    boxes = dict(sorted(boxes.items(), key=lambda item: item[0] != "TABLE"))
+    words = assign_words(parse_words(cache.image_to_data(page, lang, config)), boxes)
+    return {name: table_cells(found) if name == "TABLE" else words_text(found) for name, found in words.items()}
+
+
+def extract_tables(items, workers=None, cache=ocr_cache, lang=None, config="", mode="region"):
+    """
+    Extrait les tableaux de plusieurs images : les images absentes du cache sont reconnues en
+    parallèle sur un pool de processus (une image identique n'est reconnue qu'une fois).
+
+    Args:
+        items (list): Couples (chemin de l'image, bbox du tableau).
+        workers (int, optional): Nombre de processus tesseract. Défaut: nombre de cœurs.
+        mode (str, optional): "region" (un appel à tesseract par région de tableau) ou "page" (un
+            appel image_to_data par page, cellules reconstruites à partir des boîtes des mots).
+
+    Returns:
+        list: Données du tableau de chaque image, dans l'ordre de `items` (None si l'image est illisible).
+    """
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"Mode d'extraction inconnu : {mode}")
+    output = "data" if mode == "page" else "string"
+    engine = cache.engine(lang, config, output)
+    keys = [None] * len(items)
+    boxes = [None] * len(items)
+    texts = {}
+    images = {}
+    paths = {}
+    for n, (image_path, table_bbox) in enumerate(items):
+        try:
+            if mode == "page":
+                image = load_page(image_path)
+                boxes[n] = image_box(table_bbox, image.height)
+            else:
+                image = table_region(image_path, table_bbox)
+        except (OSError, ValueError) as e:
+            logger.error(f"ÉCHEC {image_path}: {type(e).__name__}: {e}")
+            continue
+        key = keys[n] = cache.key(image, lang, config, output)
+        if key in texts or key in images:
+            continue
+        text = cache.get(key)
+        if text is not None:
+            metrics.incr("ocr_cache_hits")
+            texts[key] = text
+        else:
+            images[key] = image
+            paths[key] = image_path
+    logger.info(f"OCR ({mode}) : {len(items)} images, {len(texts)} en cache, {len(images)} à reconnaître")
+
+    done = 0
+    total = len(images)
+    if images:
+        workers = min(workers or os.cpu_count() or 1, total)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_ocr, image, lang, config, output): key for key, image in images.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    text, seconds = future.result()
+                except Exception as e:
+                    logger.error(f"ÉCHEC OCR {paths[key]}: {type(e).__name__}: {e}")
+                    continue
+                done += 1
+                metrics.incr("ocr_calls")
+                metrics.observe("ocr", seconds)
+                cache.set(key, text, engine)
+                texts[key] = text
+                logger.info(f"[{done}/{total}] {paths[key]} : {seconds * 1000:.0f} ms")
+
+    tables = []
+    for key, box in zip(keys, boxes):
+        if key not in texts:
+            tables.append(None)
+        elif mode == "page":
+            tables.append(table_cells(assign_words(parse_words(texts[key]), {"TABLE": box})["TABLE"]))
+        else:
+            tables.append(parse_table_text(texts[key]))
+    return tables
+
+
+def main(dataset_folder="FATURA2/invoices_dataset_final", pattern="Template*_Instance0.json", output=None, workers=None, mode="region"):
+    """
+    Extrait le tableau de chaque annotation de `dataset_folder` correspondant à `pattern`.
+    """
+    items, names = [], []
+    for json_path in sorted(glob.glob(os.path.join(dataset_folder, "Annotations", "Original_Format", pattern))):
+        name = os.path.splitext(os.path.basename(json_path))[0]
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                table_bbox = json.load(f)["TABLE"][0][0]["bbox"]
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            logger.warning(f"{name} ignoré : pas de tableau ({type(e).__name__})")
+            continue
+        items.append((os.path.join(dataset_folder, "images", f"{name}.jpg"), table_bbox))
+        names.append(name)
+    start = time.perf_counter()
+    tables = extract_tables(items, workers, mode=mode)
+    counters = metrics.snapshot()["counters"]
+    logger.info(
+        f"{len(items)} tableaux en {time.perf_counter() - start:.1f} s : "
+        f"{counters.get('ocr_calls', 0)} OCR, {counters.get('ocr_cache_hits', 0)} depuis le cache"
+    )
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(dict(zip(names, tables)), f, ensure_ascii=False, indent=2)
+    return dict(zip(names, tables))
+
+
+if __name__ == "__main__":
+    import argparse
+    from metrics import setup_logging
+    parser = argparse.ArgumentParser(description="Extrait par OCR (avec cache) les tableaux des modèles FATURA2")
+    parser.add_argument("--dataset", default="FATURA2/invoices_dataset_final", help="dossier du jeu de données FATURA2")
+    parser.add_argument("--pattern", default="Template*_Instance0.json", help="annotations à traiter (motif glob)")
+    parser.add_argument("--output", default=None, help="fichier JSON des tableaux extraits")
+    parser.add_argument("--workers", type=int, default=None, help="processus tesseract (défaut: nombre de cœurs)")
+    parser.add_argument("--mode", choices=list(EXTRACT_MODES), default="region", help="un appel tesseract par région de tableau, ou un appel image_to_data par page avec reconstruction des colonnes")
+    parser.add_argument("--log-level", default="INFO", help="niveau des journaux")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    main(args.dataset, args.pattern, args.output, args.workers, args.mode)
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+
+class BaseLayerCache:
+    """
+    Pages de base des modèles (fond, logo, textes constants), rendues une fois et copiées pour chaque instance.
+
+    Les pages sont gardées dans un LRU borné en octets ; get() retourne toujours une copie, que
+    l'appelant peut dessiner sans modifier la page en cache.
+
+    Args:
+        max_bytes (int, optional): Taille maximale des pages gardées en mémoire.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._layers = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.builds = 0
+
+    @staticmethod
+    def _nbytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, key, build):
+        """
+        Retourne une copie de la page `key`, construite avec build() au premier appel.
+
+        Args:
+            key (tuple): Tout ce dont dépend la page (modèle, taille, logo, textes constants...).
+            build (callable): Fonction sans argument qui retourne (image, extra).
+
+        Returns:
+            tuple: (copie de l'image, extra).
+        """
+        entry = self._layers.get(key)
+        if entry is not None:
+            self._layers.move_to_end(key)
+            self.hits += 1
+        else:
+            entry = self._layers[key] = build()
+            self.builds += 1
+            self._bytes += self._nbytes(entry[0])
+            while self._bytes > self.max_bytes and len(self._layers) > 1:
+                _, (evicted, _) = self._layers.popitem(last=False)
+                self._bytes -= self._nbytes(evicted)
+        img, extra = entry
+        return img.copy(), extra
+
+    def stats(self):
+        return {
+            "layers": len(self._layers),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "builds": self.builds,
+        }
@@ -0,0 +1,111 @@
+import math
+import os
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+from metrics import metrics
+
+
+class TextSpriteCache:
+    """
+    Masques en niveaux de gris des textes déjà rendus, collés avec Image.paste au lieu de redessiner le texte.
+
+    Un masque est indexé par (texte, police, décalage sous-pixel) : la couleur est appliquée au
+    collage. Avec subpixel=N, le décalage sous-pixel est ramené au centre de son intervalle de 1/N
+    de pixel pour que les positions voisines partagent le même masque. L'écart de position avec
+    draw.text est d'au plus 1/(2N) pixel ; avec les polices hintées, FreeType arrondit presque
+    toujours au même pixel, mais pas toujours : quelques tracés sur cent ont un bord de glyphe
+    décalé d'un pixel (version 2 du générateur). subpixel=None garde le
+    décalage exact (rendu identique, mais peu de masques réutilisés). Les masques sont gardés
+    dans un LRU borné en octets.
+
+    Args:
+        max_bytes (int, optional): Taille maximale des masques gardés en mémoire.
+        subpixel (int, optional): Nombre de positions sous-pixel distinctes par pixel.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, subpixel=2):
+        self.max_bytes = max_bytes
+        self.subpixel = subpixel
+        self._masks = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _quantize(self, value):
+        origin = math.floor(value)
+        fraction = value - origin
+        if self.subpixel:
+            # Centre de l'intervalle : l'écart avec la position demandée est au plus la moitié de l'intervalle
+            fraction = (math.floor(fraction * self.subpixel) + 0.5) / self.subpixel
+        return origin, fraction
+
+    @staticmethod
+    def _render(text, font, fx, fy):
+        # Rendu sur un fond noir avec une marge entière : le masque est celui de draw.text, décalé
+        left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((fx, fy), text, font=font)
+        ox = 1 - min(0, math.floor(left))
+        oy = 1 - min(0, math.floor(top))
+        canvas = Image.new("L", (math.ceil(right) + ox + 1, math.ceil(bottom) + oy + 1), 0)
+        ImageDraw.Draw(canvas).text((ox + fx, oy + fy), text, fill=255, font=font)
+        box = canvas.getbbox()
+        if box is None:
+            return None, (0, 0)
+        return canvas.crop(box), (box[0] - ox, box[1] - oy)
+
+    def get(self, text, font, fx=0.0, fy=0.0):
+        """
+        Retourne (masque, décalage) du texte dessiné au décalage sous-pixel (fx, fy), rendu au premier appel.
+        """
+        key = (text, font, fx, fy)
+        entry = self._masks.get(key)
+        if entry is not None:
+            self._masks.move_to_end(key)
+            self.hits += 1
+            metrics.incr("text_sprite_hits")
+            return entry
+        self.misses += 1
+        metrics.incr("text_sprite_misses")
+        entry = self._masks[key] = self._render(text, font, fx, fy)
+        if entry[0] is not None:
+            self._bytes += entry[0].width * entry[0].height
+        while self._bytes > self.max_bytes and len(self._masks) > 1:
+            _, (evicted, _) = self._masks.popitem(last=False)
+            if evicted is not None:
+                self._bytes -= evicted.width * evicted.height
+        return entry
+
+    def draw(self, img, position, text, fill="black", font=None):
+        """
+        Équivalent de ImageDraw.Draw(img).text(position, text, fill=fill, font=font).
+        """
+        if position[0] < 0 or position[1] < 0:
+            # Pillow tronque les coordonnées négatives vers zéro : rendu direct, sans cache
+            ImageDraw.Draw(img).text(position, text, fill=fill, font=font)
+            return
+        x, fx = self._quantize(position[0])
+        y, fy = self._quantize(position[1])
+        mask, (dx, dy) = self.get(text, font, fx, fy)
+        if mask is not None:
+            img.paste(fill, (x + dx, y + dy, x + dx + mask.width, y + dy + mask.height), mask)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "sprites": len(self._masks),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Cache partagé par les champs de la facture et les cellules du tableau (un par processus) ;
+# TEXT_SPRITE_SUBPIXEL=0 garde le rendu exact de draw.text
+text_sprites = TextSpriteCache(
+    max_bytes=int(os.environ.get("TEXT_SPRITE_CACHE_MB", 32)) * 1024 * 1024,
+    subpixel=int(os.environ.get("TEXT_SPRITE_SUBPIXEL", 2)) or None,
+)
+
+
+def draw_text(img, position, text, fill="black", font=None):
+    text_sprites.draw(img, position, text, fill, font)
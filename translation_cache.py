@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Nombre de dernières utilisations gardées en mémoire avant une écriture groupée
+_TOUCH_BATCH = 256
+
+
+def normalize_text(text):
+    """
+    Normalise un texte avant de l'utiliser comme clé de cache (NFC, espaces en bord supprimés).
+    Les retours à la ligne internes sont conservés car ils sont dessinés sur la facture.
+    """
+    return unicodedata.normalize("NFC", text).strip()
+
+
+class TranslationCache:
+    """
+    Cache de traductions à deux niveaux : un LRU en mémoire devant une base SQLite sur disque.
+
+    La clé est (langue source, langue cible, texte normalisé). La connexion SQLite est ouverte
+    paresseusement et par processus, ce qui permet de partager le même fichier entre les
+    processus du pool de génération.
+
+    Args:
+        path (str, optional): Fichier SQLite. None = cache uniquement en mémoire.
+        memory_size (int, optional): Nombre d'entrées gardées dans le LRU en mémoire.
+        max_entries (int, optional): Nombre maximal d'entrées sur disque (les moins récemment utilisées sont évincées).
+
+    Les lectures n'écrivent pas sur disque : la date de dernière utilisation, utile seulement pour
+    l'éviction (max_entries), est gardée en mémoire puis écrite par paquets avec les insertions.
+    """
+
+    def __init__(self, path="translation_cache.sqlite", memory_size=4096, max_entries=None):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._inserts = 0
+        self._touched = {}
+
+    def _connection(self):
+        if self.path is None:
+            return None
+        # Une connexion SQLite ne doit pas traverser un fork
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "source TEXT, target TEXT, text TEXT, translation TEXT, last_used REAL, "
+                "PRIMARY KEY (source, target, text))"
+            )
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key):
+        # Dernière utilisation notée en mémoire ; écrite par _flush_touched dans la transaction suivante
+        if self.max_entries is None:
+            return
+        self._touched[key] = time.time()
+        if len(self._touched) >= _TOUCH_BATCH:
+            conn = self._connection()
+            if conn is not None:
+                self._flush_touched(conn)
+                conn.commit()
+
+    def _flush_touched(self, conn):
+        if self._touched:
+            conn.executemany(
+                "UPDATE translations SET last_used=max(last_used, ?) WHERE source=? AND target=? AND text=?",
+                [(used,) + key for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def get(self, text, source="en", target="fr"):
+        """
+        Retourne la traduction en cache, ou None si elle est absente.
+        """
+        key = (source, target, normalize_text(text))
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._touch(key)
+                self.hits += 1
+                return self._memory[key]
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT translation FROM translations WHERE source=? AND target=? AND text=?", key
+                ).fetchone()
+                if row is not None:
+                    self._touch(key)
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def set(self, text, translation, source="en", target="fr"):
+        key = (source, target, normalize_text(text))
+        with self._lock:
+            self._remember(key, translation)
+            conn = self._connection()
+            if conn is not None:
+                self._flush_touched(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                    key + (translation, time.time()),
+                )
+                conn.commit()
+                self._inserts += 1
+                # Éviction vérifiée par paquets pour ne pas compter la table à chaque insertion
+                if self.max_entries is not None and self._inserts % 64 == 0:
+                    self._evict(conn)
+
+    def set_many(self, items, source="en", target="fr"):
+        """
+        Enregistre plusieurs couples (texte, traduction) en une seule transaction.
+        """
+        now = time.time()
+        self._store([(source, target, normalize_text(text), translation, now) for text, translation in items])
+
+    def prime(self, items, source="en", target="fr"):
+        """
+        Ajoute des couples (texte, traduction) au LRU en mémoire seulement, sans écrire sur disque
+        (traductions déjà enregistrées par un autre processus).
+        """
+        with self._lock:
+            for text, translation in items:
+                self._remember((source, target, normalize_text(text)), translation)
+
+    def _store(self, rows):
+        with self._lock:
+            for source, target, text, translation, _ in rows:
+                self._remember((source, target, text), translation)
+            conn = self._connection()
+            if conn is not None and rows:
+                self._flush_touched(conn)
+                conn.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)", rows)
+                conn.commit()
+                if self.max_entries is not None:
+                    self._evict(conn)
+
+    def missing(self, texts, source="en", target="fr"):
+        """
+        Retourne, dans l'ordre, les textes distincts absents du cache, sans toucher aux compteurs.
+        """
+        result = []
+        seen = set()
+        with self._lock:
+            conn = self._connection()
+            for text in texts:
+                key = (source, target, normalize_text(text))
+                if key in seen or key in self._memory:
+                    continue
+                seen.add(key)
+                if conn is not None and conn.execute(
+                    "SELECT 1 FROM translations WHERE source=? AND target=? AND text=?", key
+                ).fetchone() is not None:
+                    continue
+                result.append(text)
+        return result
+
+    def _evict(self, conn):
+        self._flush_touched(conn)
+        count = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM translations WHERE rowid IN "
+                "(SELECT rowid FROM translations ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+
+    def get_or_translate(self, text, translate, source="en", target="fr"):
+        """
+        Retourne la traduction de `text`, en appelant `translate(text)` seulement en cas d'absence.
+        """
+        cached = self.get(text, source, target)
+        if cached is not None:
+            return cached
+        translation = translate(text)
+        if translation is not None:
+            self.set(text, translation, source, target)
+        return translation
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache (succès, échecs, taille mémoire et disque).
+        """
+        with self._lock:
+            conn = self._connection()
+            disk_size = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0] if conn is not None else 0
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_size": len(self._memory),
+                "disk_size": disk_size,
+            }
+
+    def items(self, source="en", target="fr"):
+        """
+        Retourne les couples (texte, traduction) en cache pour ce couple de langues.
+        """
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT text, translation FROM translations WHERE source=? AND target=?", (source, target)
+            ).fetchall() if conn is not None else []
+            entries = dict(rows)
+            entries.update((key[2], value) for key, value in self._memory.items() if key[:2] == (source, target))
+        return list(entries.items())
+
+    def export_to(self, path):
+        """
+        Exporte toutes les traductions en JSON lines pour réchauffer le cache d'une autre machine.
+
+        Returns:
+            int: Nombre d'entrées exportées.
+        """
+        with self._lock:
+            conn = self._connection()
+            if conn is not None:
+                rows = conn.execute("SELECT source, target, text, translation FROM translations").fetchall()
+            else:
+                rows = [key + (value,) for key, value in self._memory.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            for source, target, text, translation in rows:
+                f.write(json.dumps({"source": source, "target": target, "text": text, "translation": translation}, ensure_ascii=False) + "\n")
+        return len(rows)
+
+    def import_from(self, path):
+        """
+        Importe un fichier produit par export_to. Les entrées existantes sont remplacées.
+
+        Returns:
+            int: Nombre d'entrées importées.
+        """
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = (entry["source"], entry["target"], normalize_text(entry["text"]))
+                    rows.append(key + (entry["translation"], time.time()))
+        self._store(rows)
+        return len(rows)